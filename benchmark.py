@@ -0,0 +1,413 @@
+import argparse
+import multiprocessing
+import os
+import pickle
+import random
+import tempfile
+import time
+from collections.abc import Callable
+
+from src import CodeGen, Shared
+from src.CombDFA import CombDFA
+from src.CompiledDFA import CompiledDFA
+from src.DFA import DFA
+from src.Lexer import Lexer
+from src.Regex import parse_regex
+
+
+def timed(f: Callable[[], object], repeat: int = 3) -> float:
+    # best wall-clock time of 'repeat' runs
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def dict_accept(dfa: DFA, word: str) -> bool:
+    # the original dict-of-tuples simulation, kept as the baseline
+    current_state = dfa.q0
+
+    for i in range(len(word)):
+        if (current_state, word[i]) not in dfa.d:
+            return False
+
+        current_state = dfa.d[(current_state, word[i])]
+
+    return current_state in dfa.F
+
+
+def random_words(alphabet: str, count: int, min_len: int, max_len: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    return [''.join(rng.choice(alphabet) for _ in range(rng.randint(min_len, max_len))) for _ in range(count)]
+
+
+def bench_accept() -> None:
+    dfa = parse_regex('([a-z] | [A-Z] | _)([a-z] | [A-Z] | [0-9] | _)*').thompson().subset_construction()
+    words = random_words('abcXYZ_019', 100000, 4, 16)
+
+    dfa.table()
+    dict_time = timed(lambda: [dict_accept(dfa, word) for word in words])
+    table_time = timed(lambda: [dfa.accept(word) for word in words])
+
+    print(f'accept, {len(words)} words: dict {dict_time:.3f}s, table {table_time:.3f}s, '
+          f'speedup {dict_time / table_time:.2f}x')
+
+
+def redundant_dfa(n_states: int, alphabet: str, copies: int, seed: int = 0) -> DFA[int]:
+    # a random dfa with n_states // copies distinct states, each of them duplicated 'copies' times
+    rng = random.Random(seed)
+    n_classes = n_states // copies
+    final = {state for state in range(n_classes) if rng.random() < 0.5}
+
+    targets = {(state, symbol): rng.randrange(n_classes) for state in range(n_classes) for symbol in alphabet}
+    d = {}
+    for state in range(n_classes * copies):
+        for symbol in alphabet:
+            d[(state, symbol)] = targets[(state % n_classes, symbol)] + n_classes * rng.randrange(copies)
+
+    return DFA(set(alphabet), set(range(n_classes * copies)), 0, d,
+               {state for state in range(n_classes * copies) if state % n_classes in final})
+
+
+def bench_minimize() -> None:
+    for n_states in [10000, 30000, 100000]:
+        dfa = redundant_dfa(n_states, 'ab', 4)
+        start = time.perf_counter()
+        minimal = dfa.minimize()
+        elapsed = time.perf_counter() - start
+
+        print(f'minimize, {n_states} states: {len(minimal.K)} states after {elapsed:.3f}s '
+              f'({elapsed / n_states * 1e6:.2f}us per state)')
+
+
+def bench_accept_many() -> None:
+    dfa = parse_regex('([a-z] | [A-Z] | _)([a-z] | [A-Z] | [0-9] | _)*').thompson().subset_construction()
+    words = random_words('abcXYZ_019', 1000000, 4, 24)
+
+    dfa.accept_many(words[:10])
+    loop_time = timed(lambda: [dfa.accept(word) for word in words], repeat=1)
+    batch_time = timed(lambda: dfa.accept_many(words), repeat=1)
+
+    print(f'accept_many, {len(words)} words: accept loop {loop_time:.3f}s, accept_many {batch_time:.3f}s, '
+          f'speedup {loop_time / batch_time:.2f}x')
+
+
+def bench_load() -> None:
+    regex = '(([a-z] | [A-Z])+ | [0-9]+)((\\- | _ | \\.)(([a-z] | [A-Z])+ | [0-9]+))*@([a-z]+\\.)+[a-z]+'
+    build_time = timed(lambda: parse_regex(regex).thompson().subset_construction().table(), repeat=1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'dfa.bin')
+        dfa = parse_regex(regex).thompson().subset_construction()
+        dfa.save(path)
+        load_time = timed(lambda: CompiledDFA.load(path))
+
+    print(f'load, {len(dfa.K)} states: build from regex {build_time * 1e3:.2f}ms, '
+          f'load {load_time * 1e3:.3f}ms, speedup {build_time / load_time:.0f}x')
+
+
+def bench_product() -> None:
+    identifier = parse_regex('([a-z] | [A-Z] | _)([a-z] | [A-Z] | [0-9] | _)*').thompson().subset_construction()
+    has_digit = parse_regex('([a-z] | [A-Z] | _ | [0-9])*[0-9]([a-z] | [A-Z] | _ | [0-9])*').thompson()
+    has_digit = has_digit.subset_construction()
+    words = random_words('abcXYZ_019', 100000, 4, 16)
+
+    product = identifier.product(has_digit, 'difference')
+    eager = identifier.difference(has_digit).minimize()
+    eager.table()
+    separate_time = timed(lambda: [identifier.accept(word) and not has_digit.accept(word) for word in words])
+    product_time = timed(lambda: [product.accept(word) for word in words])
+    eager_time = timed(lambda: [eager.accept(word) for word in words])
+
+    print(f'product, {len(words)} words: two scans {separate_time:.3f}s, lazy product {product_time:.3f}s '
+          f'({len(product.pairs)} pair states built), eager minimized product {eager_time:.3f}s')
+
+
+def bench_equivalent() -> None:
+    for n_states in [10000, 50000]:
+        dfa = redundant_dfa(n_states, 'ab', 2)
+        minimal = dfa.minimize()
+        changed = DFA(minimal.S, minimal.K, minimal.q0, minimal.d, minimal.F ^ {len(minimal.K) - 1})
+        dfa.table(), minimal.table(), changed.table()
+
+        equivalent_time = timed(lambda: dfa.equivalent(minimal))
+        counterexample_time = timed(lambda: dfa.counterexample(changed))
+
+        print(f'equivalent, {n_states} states: equivalent dfas {equivalent_time:.3f}s, '
+              f'counterexample of length {len(dfa.counterexample(changed))} {counterexample_time:.3f}s')
+
+
+def bench_trim() -> None:
+    dfa = parse_regex('([a-z] | [A-Z] | _)([a-z] | [A-Z] | [0-9] | _)*').thompson().subset_construction()
+    words = ['0' + word for word in random_words('abcXYZ_019', 1000, 1000, 10000)]
+    untrimmed = dfa.compile(trim=False)
+    trimmed = dfa.compile()
+
+    untrimmed_time = timed(lambda: [untrimmed.accept(word) for word in words])
+    trimmed_time = timed(lambda: [trimmed.accept(word) for word in words])
+
+    print(f'trim, {len(words)} long rejected words: untrimmed {untrimmed_time:.3f}s, trimmed {trimmed_time:.5f}s')
+
+
+SUBSET_REGEXES = [
+    '([a-z] | [A-Z] | _)([a-z] | [A-Z] | [0-9] | _)*',
+    '(([a-z] | [A-Z])+ | [0-9]+)((\\- | _ | \\.)(([a-z] | [A-Z])+ | [0-9]+))*@([a-z]+\\.)+[a-z]+',
+    '(a|b)*a' + '(a|b)' * 10,
+]
+
+
+def bench_subset_construction() -> None:
+    for regex in SUBSET_REGEXES:
+        nfa = parse_regex(regex).thompson()
+        construction_time = timed(lambda: nfa.subset_construction(), repeat=1)
+        determinize_time = timed(lambda: nfa.determinize(), repeat=1)
+        dfa = nfa.subset_construction()
+        table = dfa.compile()
+
+        print(f'subset construction, {regex[:30]!r}: {len(nfa.K)} nfa states, {len(dfa.K)} dfa states in '
+              f'{construction_time * 1e3:.1f}ms ({determinize_time * 1e3:.1f}ms without keeping the subsets), '
+              f'{len(dfa.S)} symbols in {table.n_columns} columns')
+
+
+def bench_search() -> None:
+    dfa = parse_regex('[0-9]+@[a-z]+\\.com').thompson().subset_construction()
+    rng = random.Random(0)
+    text = ''.join(rng.choice('abcdefghij0123456789@. ') for _ in range(1000000)) + '42@example.com'
+
+    search_time = timed(lambda: list(dfa.finditer(text)), repeat=1)
+    print(f'search, {len(text) / 1e6:.1f}MB of text: {len(list(dfa.finditer(text)))} matches in {search_time:.3f}s')
+
+
+def bench_parallel() -> None:
+    regex = '[0-9]+@[a-z]+\\.com'
+    dfa = parse_regex(regex).thompson().subset_construction().unanchored()
+    byte_dfa = parse_regex(regex).thompson().to_bytes().subset_construction().unanchored()
+    rng = random.Random(0)
+    text = ''.join(rng.choice('abcdefghij0123456789@. ') for _ in range(4000000))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'text')
+        with open(path, 'w') as f:
+            f.write(text)
+        mapped = Shared.map_file(path)
+
+        serial_time = timed(lambda: dfa.table().run(text), repeat=1)
+        for processes in sorted({1, 2, os.cpu_count() or 1}):
+            parallel_time = timed(lambda: dfa.count_prefixes_parallel(text, processes), repeat=1)
+            mapped_time = timed(lambda: byte_dfa.count_prefixes_parallel(mapped, processes), repeat=1)
+            print(f'parallel, {len(text) / 1e6:.0f}M symbols on {os.cpu_count()} cpus: serial {serial_time:.3f}s, '
+                  f'{processes} processes {parallel_time:.3f}s (str in shared memory), {mapped_time:.3f}s (mapped file)')
+
+
+KEYWORDS = ['if', 'else', 'while', 'for', 'return', 'break', 'continue', 'def', 'class', 'import', 'from', 'with',
+            'lambda', 'yield', 'try', 'except', 'finally', 'raise', 'pass', 'global', 'nonlocal', 'assert']
+LEXER_SPEC = [(keyword.upper(), keyword) for keyword in KEYWORDS] + [
+    ('ID', '([a-z] | [A-Z] | _)([a-z] | [A-Z] | [0-9] | _)*'),
+    ('NUM', '[0-9]+'),
+    ('SPACE', '\\ '),
+    ('NEWLINE', '\n'),
+]
+
+
+def bench_compress() -> None:
+    lexer = Lexer(LEXER_SPEC)
+    compressed = Lexer(LEXER_SPEC, compressed=True)
+    sizes = lexer.lexer.table_sizes()
+
+    rng = random.Random(0)
+    text = ' '.join(rng.choice(KEYWORDS + random_words('abcxyz_019', 20, 1, 8)) for _ in range(20000))
+    dense_time = timed(lambda: lexer.lex(text), repeat=1)
+    comb_time = timed(lambda: compressed.lex(text), repeat=1)
+
+    print(f'compress, lexer with {len(lexer.lexer.K)} states: dict {sizes["dict"]} entries, '
+          f'dense {sizes["dense"]} cells, comb {sizes["comb"]} cells '
+          f'({sizes["dense"] / sizes["comb"]:.1f}x smaller than dense, {sizes["dict"] / sizes["comb"]:.1f}x than dict); '
+          f'lex: dense {dense_time:.3f}s, comb {comb_time:.3f}s')
+
+    for count in [10000, 50000]:
+        dfa = DFA.from_words(random_words('abcdefghijklmnopqrstuvwxyz', count, 3, 12))
+        table = dfa.table()
+        build_time = timed(lambda: CombDFA.from_table(table), repeat=1)
+        print(f'compress, {len(dfa.K)} state dfa from {count} words: comb form built in {build_time:.3f}s, '
+              f'dense {len(table.table)} cells, comb {dfa.compress().cells()} cells')
+
+
+def bench_codegen() -> None:
+    regexes = ['([a-z] | [A-Z] | _)([a-z] | [A-Z] | [0-9] | _)*', 'while | whale | (ab)*c']
+    batches = {
+        'short': random_words('abcXYZ_019', 100000, 4, 16) + ['while', 'whale', 'ababababc'] * 10000,
+        'long': random_words('abcXYZ_019', 1000, 1000, 5000),
+    }
+
+    for regex in regexes:
+        dfa = parse_regex(regex).thompson().subset_construction()
+        with tempfile.TemporaryDirectory() as directory:
+            generate_time = timed(lambda: CodeGen.compile_dfa(dfa, cache_dir=directory), repeat=1)
+            accept = CodeGen.compile_dfa(dfa, cache_dir=directory)
+
+        for batch, words in batches.items():
+            table_time = timed(lambda: [dfa.accept(word) for word in words])
+            generated_time = timed(lambda: [accept(word) for word in words])
+
+            print(f'codegen, {regex[:30]!r}, {len(words)} {batch} words: table {table_time:.3f}s, '
+                  f'generated {generated_time:.3f}s (speedup {table_time / generated_time:.2f}x, '
+                  f'generated and imported in {generate_time * 1e3:.1f}ms)')
+
+    # keyword dfas with more states: the dispatch on the state grows with them, so past CodeGen.MAX_STATES
+    # compile_dfa keeps the table. the generated code is also run on its own, to show what it would cost
+    for count in [15, 100, 1000]:
+        keywords = random_words('abcdefghijklmnop', count, 3, 10)
+        table = DFA.from_words(keywords).minimize().table()
+        words = keywords * (30000 // count) + random_words('abcdefghijklmnop', 30000, 3, 10, seed=1)
+        namespace = {}
+        exec(CodeGen.to_python_source(table), namespace)
+        with tempfile.TemporaryDirectory() as directory:
+            accept = CodeGen.compile_dfa(table, cache_dir=directory)
+
+        table_time = timed(lambda: [table.accept(word) for word in words])
+        generated_time = timed(lambda: [namespace['accept'](word) for word in words])
+        compiled_time = timed(lambda: [accept(word) for word in words])
+        print(f'codegen, {table.n_states} state keyword dfa, {len(words)} words: table {table_time:.3f}s, '
+              f'generated {generated_time:.3f}s, compile_dfa {compiled_time:.3f}s '
+              f'(uses the {"table" if table.n_states > CodeGen.MAX_STATES else "generated code"})')
+
+
+def bench_count() -> None:
+    dfa = parse_regex(SUBSET_REGEXES[1]).thompson().subset_construction()
+    for length in [10, 1000, 5000]:
+        count_time = timed(lambda: dfa.count_accepted(length), repeat=1)
+        count = dfa.count_accepted(length)
+
+        print(f'count, {len(dfa.table().symbols)} symbols, {dfa.table().n_states} states, length {length}: '
+              f'{count.bit_length()} bit count in {count_time * 1e3:.1f}ms')
+
+
+def bench_words() -> None:
+    rng = random.Random(0)
+    words = sorted({''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 10)))
+                    for _ in range(20000)})
+
+    # much longer alternations overflow the recursion of the regex parser
+    for count in [250, 500]:
+        regex = ' | '.join(words[:count])
+        regex_time = timed(lambda: Lexer([('KEYWORD', regex), ('SPACE', '\\ ')]), repeat=1)
+        words_time = timed(lambda: Lexer([('KEYWORD', DFA.from_words(words[:count])), ('SPACE', '\\ ')]), repeat=1)
+        print(f'words, lexer with {count} keywords: from regex {regex_time:.3f}s, from words {words_time:.3f}s')
+
+    build_time = timed(lambda: DFA.from_words(words), repeat=1)
+    lexer_time = timed(lambda: Lexer([('KEYWORD', DFA.from_words(words)), ('SPACE', '\\ ')]), repeat=1)
+    print(f'words, {len(words)} keywords: {len(DFA.from_words(words).K)} state dfa in {build_time:.3f}s, '
+          f'lexer in {lexer_time:.3f}s')
+
+
+def bench_lexer_words() -> None:
+    # lexers over large lists of keywords: the nfa has a state per node of the keyword trie, and most of the subsets
+    # of the subset construction only hold a few of them (see NFA.determinize)
+    rng = random.Random(0)
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 10))) for _ in range(50000)]
+    identifier = '([a-z] | [A-Z] | _)([a-z] | [A-Z] | [0-9] | _)*'
+
+    for count in [20000, 50000]:
+        keywords = DFA.from_words(words[:count])
+        lexer_time = timed(lambda: Lexer([('KEYWORD', keywords), ('ID', identifier), ('SPACE', '\\ ')]), repeat=1)
+        print(f'lexer words, {count} keywords ({len(keywords.K)} state dfa) and identifiers: {lexer_time:.3f}s')
+
+
+def accept_copied(dfa: DFA, words: list[str]) -> int:
+    return sum(map(dfa.accept, words))
+
+
+def accept_shared(handle: object, words: list[str]) -> int:
+    table = handle.attach()
+    return sum(map(table.accept, words))
+
+
+def bench_shared() -> None:
+    rng = random.Random(0)
+    keywords = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 10))) for _ in range(20000)]
+    dfa = DFA.from_words(keywords)
+    dfa.table()
+    chunks = [keywords[start:start + 500] for start in range(0, len(keywords), 500)]
+
+    with multiprocessing.Pool(2) as pool:
+        copied_time = timed(lambda: pool.starmap(accept_copied, [(dfa, chunk) for chunk in chunks]), repeat=1)
+        with dfa.share() as handle:
+            shared_time = timed(lambda: pool.starmap(accept_shared, [(handle, chunk) for chunk in chunks]), repeat=1)
+
+    print(f'shared, {len(dfa.K)} state dfa, {len(chunks)} tasks: pickled dfa of {len(pickle.dumps(dfa)) >> 10}KB '
+          f'per task {copied_time:.3f}s, shared memory handle of {len(pickle.dumps(handle))}B {shared_time:.3f}s')
+
+
+def bench_nfa() -> None:
+    # the dfa of this regex has 2^21 states, the nfa is simulated directly
+    nfa = parse_regex('(a|b)*a' + '(a|b)' * 20).thompson()
+    rng = random.Random(0)
+    text = ''.join(rng.choice('ab') for _ in range(100000))
+
+    accept_time = timed(lambda: nfa.accept(text), repeat=1)
+    search_time = timed(lambda: nfa.search(text), repeat=1)
+    print(f'nfa, {len(nfa.K)} states, {len(text)} symbols: accept {accept_time:.3f}s, search {search_time:.3f}s')
+
+    lazy = nfa.lazy()
+    lazy_time = timed(lambda: lazy.accept(text), repeat=1)
+    print(f'nfa, lazy dfa on the same text: {lazy_time:.3f}s ({lazy.clears} cache clears, {lazy.fallbacks} fallbacks)')
+
+    # a text that only reaches a few of the states
+    text = ''.join(rng.choice('bbbbbbbbbbbbbbbbbbba') for _ in range(100000))
+    lazy = nfa.lazy()
+    lazy_time = timed(lambda: lazy.accept(text), repeat=1)
+    print(f'nfa, lazy dfa on a text with few a: {lazy_time:.3f}s ({len(lazy.subsets)} states built, '
+          f'{lazy.clears} cache clears)')
+
+
+def bench_epsilons() -> None:
+    rng = random.Random(0)
+    text = ''.join(rng.choice('ab') for _ in range(20000))
+    for regex in SUBSET_REGEXES + ['(a|b)*a' + '(a|b)' * 20]:
+        nfa = parse_regex(regex).thompson()
+        remove_time = timed(lambda: nfa.remove_epsilons(), repeat=1)
+        free = nfa.remove_epsilons()
+
+        accept_time = timed(lambda: nfa.accept(text), repeat=1)
+        free_accept_time = timed(lambda: free.accept(text), repeat=1)
+        print(f'epsilons, {regex[:30]!r}: {len(nfa.K)} states, {len(nfa.d)} transitions -> {len(free.K)} states, '
+              f'{len(free.d)} transitions in {remove_time * 1e3:.1f}ms; accept of {len(text)} symbols '
+              f'{accept_time:.3f}s -> {free_accept_time:.3f}s')
+
+
+BENCHMARKS = {
+    'accept': bench_accept,
+    'minimize': bench_minimize,
+    'accept_many': bench_accept_many,
+    'load': bench_load,
+    'product': bench_product,
+    'equivalent': bench_equivalent,
+    'trim': bench_trim,
+    'subset_construction': bench_subset_construction,
+    'search': bench_search,
+    'parallel': bench_parallel,
+    'compress': bench_compress,
+    'codegen': bench_codegen,
+    'count': bench_count,
+    'words': bench_words,
+    'lexer_words': bench_lexer_words,
+    'shared': bench_shared,
+    'nfa': bench_nfa,
+    'epsilons': bench_epsilons,
+}
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('benchmarks', nargs='*', metavar='benchmark', help=f'any of {", ".join(BENCHMARKS)}')
+
+    args = argparser.parse_args()
+
+    for name in args.benchmarks or BENCHMARKS:
+        if name not in BENCHMARKS:
+            argparser.error(f'unknown benchmark {name}')
+
+        BENCHMARKS[name]()
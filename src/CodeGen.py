@@ -0,0 +1,244 @@
+import hashlib
+import importlib.util
+import os
+import stat
+import tempfile
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Any
+
+from .CompiledDFA import CompiledDFA, SINK, Symbol, join_symbols
+
+if TYPE_CHECKING:
+    from .DFA import DFA
+
+# where compile_dfa keeps the generated modules, unless it is given another directory. the modules in it are
+# imported, so it is a directory of this user (in XDG_CACHE_HOME, ~/.cache by default), not a shared one like /tmp
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                         'lfa_codegen')
+MIN_RUN = 2  # the shortest straight-line run of transitions checked with a single startswith
+WINDOW = 64  # self-loops are skipped with lstrip over windows of this many symbols, so a window is never copied twice
+MAX_STATES = 100  # compile_dfa only generates code for tables with at most this many states, see to_python_source
+
+_loaded: dict[str, Callable[..., bool]] = {}
+
+
+def _code(symbol: Symbol) -> int:
+    # the code point of a character, or the value of a byte
+    return symbol if isinstance(symbol, int) else ord(symbol)
+
+
+def _literal(symbols: list[Symbol]) -> str:
+    # the source of a str (or, for int symbols, bytes) literal holding the symbols
+    return repr(join_symbols(symbols))
+
+
+def _condition(symbols: list[Symbol]) -> str:
+    # the source of a test of whether the current symbol, c, is one of 'symbols'. runs of at least 3 consecutive
+    # code points become range comparisons, the other symbols a single equality or a membership test on a literal
+    codes = sorted(map(_code, symbols))
+    value: Callable[[int], Symbol] = (lambda code: code) if isinstance(symbols[0], int) else chr
+
+    tests = []
+    single: list[Symbol] = []
+    start = 0
+    while start < len(codes):
+        end = start
+        while end + 1 < len(codes) and codes[end + 1] == codes[end] + 1:
+            end += 1
+
+        if end - start >= 2:
+            tests.append(f'{value(codes[start])!r} <= c <= {value(codes[end])!r}')
+        else:
+            single.extend(value(code) for code in codes[start:end + 1])
+        start = end + 1
+
+    if len(single) == 1:
+        tests.append(f'c == {single[0]!r}')
+    elif single:
+        tests.append(f'c in {_literal(single)}')
+
+    return ' or '.join(tests)
+
+
+def to_python_source(table: CompiledDFA, name: str = 'accept') -> str:
+    # the source of a module defining a single function, 'name', which does the same as table.accept for a word
+    # (a str, or bytes for byte-level dfas). the transition function is unrolled into a match on the current state,
+    # with the transitions of every state written out as comparisons on the current symbol, so there is no table
+    # lookup or dict hashing per symbol. on top of that, a state with a self-loop skips the symbols of the loop with
+    # lstrip, and a chain of states with a single transition each is matched by one startswith, so the runs are
+    # scanned by the string methods rather than one symbol at a time.
+    # the match on the state compiles to a chain of comparisons, one per case, so every symbol costs time linear in
+    # the number of states: the code only beats the table for small dfas (up to about 130 states on short words,
+    # while with 5000 states it is 20 times slower). compile_dfa falls back to the table above MAX_STATES states.
+    if table.other is not None:
+        raise ValueError('cannot generate code for a table with transitions on the symbols outside its alphabet')
+
+    symbols: list[list[Symbol]] = [[] for _ in range(table.n_columns)]
+    for symbol, column in sorted(table.symbols.items(), key=lambda item: (item[1], str(item[0]))):
+        if isinstance(symbol, int) or len(symbol) == 1:
+            symbols[column].append(symbol)
+
+    # the symbols leading from every state to every next state
+    targets: list[dict[int, list[Symbol]]] = []
+    for state in range(table.n_states):
+        row = state * table.n_columns
+        state_targets: dict[int, list[Symbol]] = {}
+        for column in range(table.n_columns):
+            next_state = table.table[row + column]
+            if next_state != SINK and symbols[column]:
+                state_targets.setdefault(next_state, []).extend(symbols[column])
+        targets.append(state_targets)
+
+    lines = [
+        '# generated by CodeGen.to_python_source, do not edit',
+        '',
+        '',
+        f'def {name}(word):',
+        f'    state = {table.q0}',
+        '    i = 0',
+        '    n = len(word)',
+        '    while i < n:',
+        '        match state:',
+    ]
+
+    for state in range(table.n_states):
+        lines.append(f'            case {state}:')
+
+        # follow the transitions while there is exactly one, and check the whole run at once
+        run = []
+        end = state
+        seen = {state}
+        while len(targets[end]) == 1:
+            ((next_state, run_symbols),) = targets[end].items()
+            if len(run_symbols) != 1 or next_state in seen:
+                break
+
+            run.append(run_symbols[0])
+            seen.add(next_state)
+            end = next_state
+
+        if len(run) >= MIN_RUN:
+            lines += [
+                f'                if word.startswith({_literal(run)}, i):',
+                f'                    state = {end}',
+                f'                    i += {len(run)}',
+                '                    continue',
+            ]
+
+        if not targets[state]:
+            lines.append('                return False')
+            continue
+
+        loop = targets[state].get(state)
+        if loop:
+            lines += [
+                '                while i < n:',
+                f'                    window = word[i:i + {WINDOW}]',
+                f'                    rest = window.lstrip({_literal(sorted(loop, key=_code))})',
+                '                    i += len(window) - len(rest)',
+                '                    if rest:',
+                '                        c = rest[0]',
+                '                        break',
+                '                else:',
+                '                    break',
+            ]
+        else:
+            lines.append('                c = word[i]')
+
+        keyword = 'if'
+        for next_state, next_symbols in sorted(targets[state].items(), key=lambda item: -len(item[1])):
+            if next_state == state:
+                continue
+
+            lines += [
+                f'                {keyword} {_condition(next_symbols)}:',
+                f'                    state = {next_state}',
+            ]
+            keyword = 'elif'
+
+        if keyword == 'if':
+            lines.append('                return False')
+        else:
+            lines += [
+                '                else:',
+                '                    return False',
+                '                i += 1',
+            ]
+
+    final = [state for state in range(table.n_states) if table.final[state]]
+    if final:
+        lines += [
+            '    match state:',
+            f'        case {" | ".join(map(str, final))}:',
+            '            return True',
+            '    return False',
+        ]
+    else:
+        lines.append('    return False')
+
+    return '\n'.join(lines) + '\n'
+
+
+def _check_directory(directory: str) -> None:
+    # create the cache directory, accessible by this user only, and make sure nobody else can write to it: a module
+    # planted there would run in every process which compiles the same dfa
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    status = os.lstat(directory)
+    if not stat.S_ISDIR(status.st_mode):
+        raise PermissionError(f'code cache {directory} is not a directory')
+    if os.name == 'posix' and (status.st_uid != os.getuid() or status.st_mode & (stat.S_IWGRP | stat.S_IWOTH)):
+        raise PermissionError(f'code cache {directory} is not a private directory of this user')
+
+
+def _has_source(path: str, source: str) -> bool:
+    # whether the file at 'path' holds exactly 'source'
+    try:
+        with open(path, encoding='utf-8') as f:
+            return f.read() == source
+    except (FileNotFoundError, UnicodeDecodeError):
+        return False
+
+
+def compile_dfa(dfa: 'CompiledDFA | DFA[Any]', name: str = 'accept',
+                cache_dir: str | None = None) -> Callable[..., bool]:
+    # the accept function generated by to_python_source for a compiled table, or by DFA.to_python_source for a
+    # dfa, imported as a module. for a table with more than MAX_STATES states, which the generated code would only
+    # slow down, or one with an other column, which it does not support, this is the accept method of the table.
+    # the module is written to 'cache_dir' (CACHE_DIR by default) under the hash of its source, so later calls,
+    # in this process or any other, import the same file and reuse its cached bytecode instead of compiling it again.
+    # the directory has to be private to this user (PermissionError otherwise), and a file found in it is only
+    # imported if it holds the generated source, otherwise it is written again
+    # like in DFA.to_python_source, a dfa is compiled from its minimal form
+    table = dfa if isinstance(dfa, CompiledDFA) else dfa.minimize().table()
+    if table.n_states > MAX_STATES or table.other is not None:
+        return table.accept
+
+    source = to_python_source(table, name)
+    module_name = 'lfa_dfa_' + hashlib.sha256(source.encode('utf-8')).hexdigest()[:24]
+
+    directory = CACHE_DIR if cache_dir is None else cache_dir
+    path = os.path.join(directory, module_name + '.py')
+    if path in _loaded:
+        return _loaded[path]
+
+    _check_directory(directory)
+    if not _has_source(path, source):
+        # written under a temporary name and renamed, so a concurrent import never sees a partial file. bytecode
+        # cached for another file of the same name is dropped
+        fd, temporary_path = tempfile.mkstemp(suffix='.py', dir=directory)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(source)
+        os.replace(temporary_path, path)
+        try:
+            os.unlink(importlib.util.cache_from_source(path))
+        except FileNotFoundError:
+            pass
+
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f'cannot import the generated module {path}')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    _loaded[path] = getattr(module, name)
+    return _loaded[path]
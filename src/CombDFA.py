@@ -0,0 +1,127 @@
+from array import array
+from collections import Counter
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+from .CompiledDFA import CompiledDFA, SINK, Symbol, symbols_of
+
+MAX_CANDIDATES = 64  # the number of offsets tried for a row before it is placed at the end of the table
+
+
+@dataclass
+class CombDFA:
+    # a compressed form of a compiled dfa (the row displacement scheme used by flex and yacc). every state gets a
+    # default transition, the most common target of its row, and only the other transitions are stored: the
+    # transitions of a state are laid out in next[base[state] + column], with check[base[state] + column] == state
+    # marking the slots that belong to it, and the rows are overlapped (first fit) so that they fill each other's
+    # gaps. a lookup is still O(1): a slot that is not owned by the state means the default transition.
+    symbols: dict[Symbol, int]
+    n_states: int
+    n_columns: int
+    q0: int
+    base: array[int]
+    next: array[int]
+    check: array[int]
+    default: array[int]
+    final: bytearray | memoryview
+    other: int | None = None  # the column of the symbols outside the alphabet, see CompiledDFA
+
+    @staticmethod
+    def from_table(table: CompiledDFA) -> 'CombDFA':
+        # the non-default transitions of every row, as (column, next state) pairs
+        rows = []
+        default = array('i', [SINK]) * table.n_states
+        for state in range(table.n_states):
+            row = table.table[state * table.n_columns:(state + 1) * table.n_columns]
+            if len(row):
+                default[state] = Counter(row).most_common(1)[0][0]
+            rows.append([(column, next_state) for column, next_state in enumerate(row) if next_state != default[state]])
+
+        # the fullest rows are placed first, while there is still room for them
+        base = array('i', [0]) * table.n_states
+        used = bytearray()
+        first_free = 0
+        for state in sorted(range(table.n_states), key=lambda state: -len(rows[state])):
+            if not rows[state]:
+                continue
+
+            # the offsets tried are the ones where the first column of the row lands on a free slot, found with a
+            # scan of the bitmap, so the search jumps over the filled part of the table instead of trying every
+            # offset one by one. like in flex, the search is bounded: after MAX_CANDIDATES offsets that do not fit,
+            # the row goes to the end of the table, so the holes no row fits in do not make the placement quadratic
+            first_column = rows[state][0][0]
+            offset = max(first_free - first_column, 0)
+            placed = False
+            for _ in range(MAX_CANDIDATES):
+                slot = used.find(0, offset + first_column)
+                if slot == -1:
+                    break
+
+                offset = slot - first_column
+                if not any(offset + column < len(used) and used[offset + column] for column, _ in rows[state]):
+                    placed = True
+                    break
+                offset += 1
+
+            if not placed:
+                offset = max(offset, len(used) - first_column)
+
+            base[state] = offset
+            end = offset + rows[state][-1][0] + 1
+            if end > len(used):
+                used.extend(bytes(end - len(used)))
+            for column, _ in rows[state]:
+                used[offset + column] = 1
+            while first_free < len(used) and used[first_free]:
+                first_free += 1
+
+        # padding, so that base[state] + column never goes out of bounds
+        size = max(base, default=0) + table.n_columns
+        next_states = array('i', [SINK]) * size
+        check = array('i', [SINK]) * size
+        for state in range(table.n_states):
+            for column, next_state in rows[state]:
+                next_states[base[state] + column] = next_state
+                check[base[state] + column] = state
+
+        return CombDFA(dict(table.symbols), table.n_states, table.n_columns, table.q0, base, next_states, check,
+                       default, table.final, table.other)
+
+    def cells(self) -> int:
+        # the number of ints stored by the compressed table
+        return len(self.base) + len(self.next) + len(self.check) + len(self.default)
+
+    def step(self, state: int, symbol: Symbol) -> int:
+        column = self.symbols.get(symbol, self.other)
+        if column is None or state == SINK:
+            return SINK
+
+        index = self.base[state] + column
+        return self.next[index] if self.check[index] == state else self.default[state]
+
+    def run(self, word: Iterable[Symbol], state: int | None = None) -> int:
+        symbols = self.symbols
+        base = self.base
+        next_states = self.next
+        check = self.check
+        default = self.default
+        other = self.other
+        current_state = self.q0 if state is None else state
+
+        for symbol in symbols_of(word):
+            column = symbols.get(symbol, other)
+            if column is None:
+                return SINK
+
+            index = base[current_state] + column
+            current_state = next_states[index] if check[index] == current_state else default[current_state]
+            if current_state == SINK:
+                return SINK
+
+        return current_state
+
+    def is_final(self, state: int) -> bool:
+        return state != SINK and self.final[state] == 1
+
+    def accept(self, word: Iterable[Symbol]) -> bool:
+        return self.is_final(self.run(word))
@@ -0,0 +1,502 @@
+from array import array
+from bisect import bisect_left
+from operator import mul
+from collections.abc import Buffer, Hashable, Iterable, Iterator, Sequence
+from dataclasses import dataclass, field
+from typing import cast
+
+from . import Storage
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, without it batches are simulated one word at a time
+    numpy = None  # type: ignore[assignment]
+
+SINK = -1  # marks a missing transition in the table. once a word reaches it, it can no longer be accepted
+BATCH_SIZE = 1 << 16  # the number of words encoded at once by accept_many
+DFA_KIND = b'D'
+
+type Symbol = str | int  # a symbol of an alphabet: a character, or a byte for byte-level automata (see NFA.to_bytes)
+
+
+def symbols_of(word: Iterable[Symbol]) -> Iterable[Symbol]:
+    # the symbols of a word. a bytes-like word is read through a memoryview of its bytes, since iterating some of
+    # them (like mmap) gives 1-byte bytes objects instead of the ints byte-level automata run on
+    return memoryview(word).cast('B') if isinstance(word, Buffer) else word
+
+
+def join_symbols(symbols: Sequence[Symbol]) -> str | bytes:
+    # the word made of the symbols: bytes for byte-level symbols (ints), a str otherwise
+    if symbols and isinstance(symbols[0], int):
+        return bytes(cast(Sequence[int], symbols))
+
+    return ''.join(cast(Sequence[str], symbols))
+
+
+def symbol_outside(symbols: Iterable[Symbol]) -> Symbol | None:
+    # a symbol which is not one of 'symbols' (the first free byte for byte-level alphabets, the first free
+    # character otherwise), to stand for all the symbols outside an alphabet. None if every byte is taken
+    symbols = set(symbols)
+    if any(isinstance(symbol, int) for symbol in symbols):
+        return next((byte for byte in range(256) if byte not in symbols), None)
+
+    code = 0
+    while chr(code) in symbols:
+        code += 1
+
+    return chr(code)
+
+
+@dataclass
+class CompiledDFA:
+    # a dfa laid out for fast simulation: the states are numbered 0..n_states-1 (the initial state is always 0
+    # after DFA.compile), each symbol of the alphabet is mapped to a column (symbols with the same transitions from
+    # every state share one) and the transition function is a flat, row-major table, so
+    # table[state * n_columns + column] is the next state (or SINK). 'other' is the column of the symbols outside
+    # the alphabet, if they have transitions (see DFA.other), otherwise they lead to SINK. a table loaded from a file
+    # is a read-only view of the memory-mapped file instead of an array.
+    symbols: dict[Symbol, int]
+    n_states: int
+    n_columns: int
+    q0: int
+    table: array[int] | memoryview
+    final: bytearray | memoryview
+    other: int | None = None
+    _gather: dict[type, tuple['numpy.ndarray', 'numpy.ndarray', 'numpy.ndarray', int]] = field(
+        default_factory=dict, init=False, repr=False, compare=False)
+
+    def step(self, state: int, symbol: Symbol) -> int:
+        # a single transition. returns SINK if the symbol is not in the alphabet (and there is no other column) or the
+        # transition is not defined
+        column = self.symbols.get(symbol, self.other)
+        if column is None or state == SINK:
+            return SINK
+
+        return self.table[state * self.n_columns + column]
+
+    def run(self, word: Iterable[Symbol], state: int | None = None) -> int:
+        # simulate the table on the word, starting from 'state' (q0 by default), and return the state it stops in
+        symbols = self.symbols
+        table = self.table
+        n_columns = self.n_columns
+        other = self.other
+        current_state = self.q0 if state is None else state
+
+        for symbol in symbols_of(word):
+            column = symbols.get(symbol, other)
+            if column is None:
+                return SINK
+
+            current_state = table[current_state * n_columns + column]
+            if current_state == SINK:
+                return SINK
+
+        return current_state
+
+    def is_final(self, state: int) -> bool:
+        return state != SINK and self.final[state] == 1
+
+    def accept(self, word: Iterable[Symbol]) -> bool:
+        return self.is_final(self.run(word))
+
+    def search(self, text: Sequence[Symbol], start: int = 0) -> tuple[int, int] | None:
+        # the leftmost-longest match in text[start:], as a (start, end) span, or None. the text is read once, from
+        # left to right, by the unanchored version of the dfa (the dfa with a .* loop in front of it): a new run
+        # of the dfa starts at every position, but runs which reach the same state are merged, keeping the one that
+        # started first, since it is the better match from then on. so at most n_states runs are alive at any
+        # time. once a match is found no new runs are started, and the scan stops as soon as no run that started
+        # no later than the match is alive anymore.
+        symbols = self.symbols
+        table = self.table
+        n_columns = self.n_columns
+        final = self.final
+        other = self.other
+
+        q0_row = self.q0 * n_columns
+        skip = not self.is_final(self.q0)
+
+        runs: dict[int, int] = {}
+        best: tuple[int, int] | None = None
+        position = start
+        while True:
+            if best is None and not runs and skip:
+                # nothing is running, so skip the positions where a new run would die right away
+                while position < len(text):
+                    column = symbols.get(text[position], other)
+                    if column is not None and table[q0_row + column] != SINK:
+                        break
+                    position += 1
+
+            if best is None:
+                runs.setdefault(self.q0, position)
+
+            for state, run_start in runs.items():
+                if final[state] and (best is None or run_start < best[0]
+                                     or (run_start == best[0] and position > best[1])):
+                    best = (run_start, position)
+
+            if best is not None:
+                runs = {state: run_start for state, run_start in runs.items() if run_start <= best[0]}
+                if not runs:
+                    break
+
+            if position == len(text):
+                break
+
+            column = symbols.get(text[position], other)
+            next_runs: dict[int, int] = {}
+            if column is not None:
+                for state, run_start in runs.items():
+                    next_state = table[state * n_columns + column]
+                    if next_state != SINK and run_start < next_runs.get(next_state, len(text) + 1):
+                        next_runs[next_state] = run_start
+
+            runs = next_runs
+            position += 1
+
+        return best
+
+    def finditer(self, text: Sequence[Symbol]) -> Iterator[tuple[int, int]]:
+        # the spans of all the non-overlapping leftmost-longest matches in the text. after an empty match, the next
+        # search starts one position further.
+        # the searches are all made in a single pass over the text, like search: a match is only known to be final
+        # once no run that could extend it is alive, but the next search starts at the end of the match, so the runs
+        # which start from there on are carried along, merged with the others, until then (if the match grows, the
+        # searches after it are started over from its new end). a run is dropped once it can no longer be part of a
+        # match (it started within or after the current match of its search, but before the next search), and the
+        # runs of all the searches are merged by state, keeping the earliest. this is the run the search it belongs
+        # to wants, and the later searches lose nothing: if the state led to a match, the earlier search would grow
+        # its match past their start. so at most n_states runs are alive at any time, and every symbol is read once.
+        symbols = self.symbols
+        table = self.table
+        n_columns = self.n_columns
+        final = self.final
+        other = self.other
+
+        q0_row = self.q0 * n_columns
+        skip = not self.is_final(self.q0)
+
+        # the current match of every search which found one, from matches[done] on (the ones before were yielded),
+        # and the position the search after the last of them starts at
+        runs: dict[int, int] = {}
+        matches: list[tuple[int, int]] = []
+        done = 0
+        next_start = 0
+        position = 0
+        while True:
+            if not runs and skip and position >= next_start:
+                # nothing is running, so skip the positions where a new run would die right away
+                while position < len(text):
+                    column = symbols.get(text[position], other)
+                    if column is not None and table[q0_row + column] != SINK:
+                        break
+                    position += 1
+
+            while True:
+                if position >= next_start:
+                    runs.setdefault(self.q0, position)
+
+                # the final run which started first among the ones that improve the match of their search (the first
+                # match whose start is not before the run's, or a new one if there is none)
+                best: tuple[int, int] | None = None
+                for state, run_start in runs.items():
+                    if final[state] and (best is None or run_start < best[0]):
+                        search = bisect_left(matches, (run_start,), done)
+                        if search == len(matches) or run_start < matches[search][0] or position > matches[search][1]:
+                            best = (run_start, search)
+                if best is None and position >= next_start and final[self.q0]:
+                    # the run started here was merged into an earlier one, which only does better than it from the
+                    # next position on: here it is the empty match of the last search
+                    best = (position, len(matches))
+
+                if best is None:
+                    break
+
+                run_start, search = best
+                del matches[search:]
+                matches.append((run_start, position))
+                next_start = position if position > run_start else position + 1
+                runs = {state: start for state, start in runs.items() if start <= run_start}
+
+            if done < len(matches):
+                # the matches no alive run can improve anymore are final
+                first_start = min(runs.values(), default=len(text) + 1)
+                while done < len(matches) and matches[done][0] < first_start:
+                    yield matches[done]
+                    done += 1
+                if done > 1024 and 2 * done > len(matches):
+                    del matches[:done]
+                    done = 0
+
+            if position == len(text):
+                break
+
+            column = symbols.get(text[position], other)
+            next_runs: dict[int, int] = {}
+            if column is not None:
+                for state, run_start in runs.items():
+                    next_state = table[state * n_columns + column]
+                    if next_state != SINK and run_start < next_runs.get(next_state, len(text) + 1):
+                        next_runs[next_state] = run_start
+
+            runs = next_runs
+            position += 1
+
+        yield from matches[done:]
+
+    def save(self, path: str) -> None:
+        # store the table in the binary format described in Storage
+        Storage.dump(path, DFA_KIND, *self._fields())
+
+    def pack(self) -> bytes:
+        # the table in the binary format described in Storage, as bytes (see from_buffer)
+        return Storage.pack(DFA_KIND, *self._fields())
+
+    def _fields(self) -> tuple[list[int], list[Symbol], list[Buffer]]:
+        symbols = list(self.symbols)
+        columns = array('i', self.symbols.values())
+        other = SINK if self.other is None else self.other
+        return [self.n_states, self.n_columns, self.q0, other], symbols, [self.table, self.final, columns]
+
+    @staticmethod
+    def load(path: str) -> 'CompiledDFA':
+        # load a table stored by save. the file is memory-mapped and the transitions are used in place, so loading
+        # does not depend on the size of the automaton and every process loading the file shares the same pages
+        return CompiledDFA._from_fields(*Storage.load(path, DFA_KIND), path)
+
+    @staticmethod
+    def from_buffer(data: bytes | memoryview, name: str = 'buffer') -> 'CompiledDFA':
+        # a table stored by pack, used in place: the transitions are views into 'data' (e.g. shared memory)
+        return CompiledDFA._from_fields(*Storage.unpack(data, DFA_KIND, name), name)
+
+    @staticmethod
+    def _from_fields(ints: list[int], symbols: list[Symbol], sections: list[memoryview], name: str) -> 'CompiledDFA':
+        (n_states, n_columns, q0, other), (table, final, columns) = ints, sections
+        table = table.cast('i')
+        columns = columns.cast('i')
+        if len(table) != n_states * n_columns or len(final) != n_states or len(columns) != len(symbols):
+            raise ValueError(f'{name} is truncated')
+
+        return CompiledDFA(dict(zip(symbols, columns)), n_states, n_columns, q0, table, final,
+                           None if other == SINK else other)
+
+    def accept_many(self, words: Sequence[str | bytes]) -> 'list[bool] | numpy.ndarray':
+        # accept, for a whole batch of words at once. with numpy, the words are packed into a padded array of
+        # column indices and all of them are stepped together by gathering from the table, one position at a time,
+        # and the result is a boolean array. words of very different lengths are first grouped by length (a factor
+        # of 2 at most between the shortest and the longest word of a group), so padding never more than doubles
+        # the work. without numpy, or unless the words are all str or all bytes, every word is simulated on its own.
+        if numpy is None or not (all(isinstance(word, str) for word in words)
+                                 or all(isinstance(word, bytes) for word in words)):
+            return [self.accept(word) for word in words]
+
+        result = numpy.zeros(len(words), dtype=bool)
+        lengths = numpy.fromiter(map(len, words), dtype=numpy.int64, count=len(words))
+        groups = numpy.zeros(len(words), dtype=numpy.int64)
+        numpy.log2(lengths, out=groups, where=lengths > 0, casting='unsafe')
+
+        order = numpy.lexsort((-lengths, groups))
+        bounds = numpy.flatnonzero(numpy.diff(groups[order])) + 1
+        for group in numpy.split(order, bounds):
+            for start in range(0, len(group), BATCH_SIZE):
+                batch = group[start:start + BATCH_SIZE]
+                result[batch] = self._accept_batch([words[i] for i in batch], lengths[batch])
+
+        return result
+
+    def _accept_batch(self, words: list[str | bytes], lengths: 'numpy.ndarray') -> 'numpy.ndarray':
+        # 'words' are sorted by decreasing length, so the words still being simulated at position j are always a
+        # prefix of the batch
+        kind = type(words[0]) if words else str
+        if kind not in self._gather:
+            self._gather[kind] = self._gather_tables(kind)
+        lookup, table, final, width = self._gather[kind]
+
+        max_len = int(lengths[0]) if len(words) else 0
+        if max_len == 0:
+            return numpy.full(len(words), self.is_final(self.q0))
+
+        codes: numpy.ndarray
+        if kind is str:
+            codes = numpy.array(words, dtype=f'<U{max_len}').view(numpy.uint32).reshape(len(words), max_len)
+        else:
+            codes = numpy.array(words, dtype=f'S{max_len}').view(numpy.uint8).reshape(len(words), max_len)
+        columns = lookup[numpy.minimum(codes, len(lookup) - 1)]
+
+        active = numpy.searchsorted(-lengths, -numpy.arange(1, max_len + 1), side='right')
+        states = numpy.full(len(words), self.q0, dtype=numpy.int64)
+        for position in range(max_len):
+            count = active[position]
+            states[:count] = table[states[:count] * width + columns[:count, position]]
+
+        accepted: numpy.ndarray = final[states]
+        return accepted
+
+    def _gather_tables(self, kind: type) -> tuple['numpy.ndarray', 'numpy.ndarray', 'numpy.ndarray', int]:
+        # the numpy form of the table used by accept_many: SINK becomes an extra dead state (n_states) and every
+        # code which is not a symbol of the alphabet gets the other column, or an extra column leading to it. the
+        # codes are the code points of single-character symbols for str words and the byte values of int symbols for
+        # bytes words
+        dead = self.n_states
+        width = self.n_columns + 1
+
+        table = numpy.full((self.n_states + 1, width), dead, dtype=numpy.int64)
+        dense = numpy.frombuffer(self.table, dtype=numpy.intc).reshape(self.n_states, self.n_columns)
+        table[:self.n_states, :self.n_columns] = numpy.where(dense == SINK, dead, dense)
+
+        codes = {}
+        for symbol, column in self.symbols.items():
+            if kind is str and isinstance(symbol, str) and len(symbol) == 1:
+                codes[ord(symbol)] = column
+            elif kind is bytes and isinstance(symbol, int):
+                codes[symbol] = column
+
+        lookup = numpy.full(max(codes, default=0) + 2, self.n_columns if self.other is None else self.other,
+                            dtype=numpy.int64)
+        for code, column in codes.items():
+            lookup[code] = column
+
+        final = numpy.zeros(self.n_states + 1, dtype=bool)
+        final[:self.n_states] = numpy.frombuffer(self.final, dtype=numpy.uint8) == 1
+
+        return lookup, table.ravel(), final, width
+
+    def count_accepted(self, length: int) -> int:
+        # the number of words of the given length accepted by the table. entry (i, j) of the transition-count matrix
+        # m is the number of symbols leading from state i to state j, so entry (i, j) of m^length is the number of
+        # words of that length leading from i to j, and the answer is the sum of the entries of row q0 in the final
+        # columns. the power is computed by repeated squaring, in O(n_states^3 log length) time. with numpy the
+        # matrices are int64 arrays as long as nothing can overflow (no entry of m^k exceeds the largest row sum of
+        # m to the power k), otherwise the count is computed exactly with python ints.
+        if length < 0:
+            raise ValueError(f'negative length {length}')
+
+        widths = [0] * self.n_columns
+        for column in self.symbols.values():
+            widths[column] += 1
+
+        matrix = [[0] * self.n_states for _ in range(self.n_states)]
+        for state in range(self.n_states):
+            row = state * self.n_columns
+            for column in range(self.n_columns):
+                next_state = self.table[row + column]
+                if next_state != SINK:
+                    matrix[state][next_state] += widths[column]
+
+        vector = [0] * self.n_states
+        vector[self.q0] = 1
+        largest = max(map(sum, matrix), default=0)
+        if numpy is not None and largest.bit_length() * length < 63:
+            power_array = numpy.array(matrix, dtype=numpy.int64)
+            vector_array = numpy.array(vector, dtype=numpy.int64)
+            while length:
+                if length & 1:
+                    vector_array = vector_array @ power_array
+                length >>= 1
+                if length:
+                    power_array = power_array @ power_array
+
+            return int(vector_array[numpy.frombuffer(self.final, dtype=numpy.uint8) == 1].sum())
+
+        power = matrix
+        while length:
+            if length & 1:
+                vector = [sum(map(mul, vector, column)) for column in zip(*power)]
+            length >>= 1
+            if length:
+                columns = list(zip(*power))
+                power = [[sum(map(mul, row, column)) for column in columns] for row in power]
+
+        return sum(count for state, count in enumerate(vector) if self.final[state])
+
+    def refine(self, labels: list[Hashable]) -> list[int]:
+        # hopcroft's partition refinement. 'labels' gives the initial block of every state, plus one extra entry
+        # (at index n_states) for an implicit sink state which completes the table. the result gives, for the same
+        # n_states + 1 states, the block of the coarsest partition refining 'labels' that is compatible with the
+        # transition function, so two states end up in the same block iff they are equivalent.
+        sink = self.n_states
+        n_columns = self.n_columns
+        table = self.table
+
+        predecessors: list[dict[int, list[int]]] = [{} for _ in range(n_columns)]
+        for state in range(self.n_states):
+            row = state * n_columns
+            for column in range(n_columns):
+                next_state = table[row + column]
+                predecessors[column].setdefault(sink if next_state == SINK else next_state, []).append(state)
+        for column in range(n_columns):
+            predecessors[column].setdefault(sink, []).append(sink)
+
+        block_ids: dict[Hashable, int] = {}
+        block = [block_ids.setdefault(label, len(block_ids)) for label in labels]
+        blocks: list[set[int]] = [set() for _ in block_ids]
+        for state, block_id in enumerate(block):
+            blocks[block_id].add(state)
+
+        # every initial block but the largest one has to be used as a splitter
+        largest = max(range(len(blocks)), key=lambda block_id: len(blocks[block_id]))
+        waiting = [block_id for block_id in range(len(blocks)) if block_id != largest]
+        in_waiting = set(waiting)
+
+        while waiting:
+            splitter_id = waiting.pop()
+            in_waiting.discard(splitter_id)
+            splitter = list(blocks[splitter_id])
+
+            for column in range(n_columns):
+                column_predecessors = predecessors[column]
+                touched: dict[int, list[int]] = {}
+                for state in splitter:
+                    for previous_state in column_predecessors.get(state, ()):
+                        touched.setdefault(block[previous_state], []).append(previous_state)
+
+                for block_id, marked in touched.items():
+                    if len(marked) == len(blocks[block_id]):
+                        continue
+
+                    new_block_id = len(blocks)
+                    new_block = set(marked)
+                    blocks[block_id] -= new_block
+                    blocks.append(new_block)
+                    for state in marked:
+                        block[state] = new_block_id
+
+                    if block_id in in_waiting or len(new_block) <= len(blocks[block_id]):
+                        waiting.append(new_block_id)
+                        in_waiting.add(new_block_id)
+                    else:
+                        waiting.append(block_id)
+                        in_waiting.add(block_id)
+
+        return block
+
+
+class Matcher:
+    # incremental simulation of a compiled dfa on a word that arrives in chunks. only the current state is kept, so
+    # memory does not depend on the length of the word, and a chunk boundary costs nothing: feeding 'ab' and then
+    # 'c' ends in the same state as feeding 'abc'.
+    def __init__(self, table: CompiledDFA) -> None:
+        self.table = table
+        self.state = table.q0
+
+    def feed(self, chunk: Iterable[Symbol]) -> None:
+        # advance over the next chunk. once the matcher is dead, chunks are not even looked at
+        if self.state != SINK:
+            self.state = self.table.run(chunk, self.state)
+
+    @property
+    def accepted(self) -> bool:
+        # whether the input fed so far is accepted
+        return self.table.is_final(self.state)
+
+    @property
+    def dead(self) -> bool:
+        # whether no continuation of the input fed so far can be accepted anymore
+        return self.state == SINK
+
+    def finish(self) -> bool:
+        # end the input: return whether it was accepted and reset the matcher, so it can be used for the next one
+        accepted = self.accepted
+        self.state = self.table.q0
+
+        return accepted
@@ -1,26 +1,457 @@
-from collections.abc import Callable
-from dataclasses import dataclass
+from array import array
+from collections import deque
+from collections.abc import Callable, Hashable, Iterable, Iterator, Sequence
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from .CombDFA import CombDFA
+from .CompiledDFA import CompiledDFA, Matcher, SINK, Symbol, join_symbols, symbol_outside
+from .Product import LazyProduct
+from . import CodeGen, Parallel, Shared
+
+if TYPE_CHECKING:
+    import numpy
 
 
 @dataclass
 class DFA[STATE]:
-    S: set[str]
+    S: set[Symbol]
     K: set[STATE]
     q0: STATE
-    d: dict[tuple[STATE, str], STATE]
+    d: dict[tuple[STATE, Symbol], STATE]
     F: set[STATE]
+    # the transitions on the symbols outside S, for the states which have one (see unanchored). without them, a
+    # symbol outside the alphabet rejects the word
+    other: dict[STATE, STATE] = field(default_factory=dict)
+    _table: CompiledDFA | None = field(default=None, init=False, repr=False, compare=False)
+    _table_key: tuple[object, ...] | None = field(default=None, init=False, repr=False, compare=False)
+    _comb: CombDFA | None = field(default=None, init=False, repr=False, compare=False)
+
+    @staticmethod
+    def from_words(words: Iterable[str | bytes]) -> 'DFA[int]':
+        # the minimal dfa accepting exactly the given words (str, or bytes for a byte-level dfa), built directly with
+        # daciuk's incremental algorithm instead of going through a regex and an nfa. the words are added in sorted
+        # order, so the states of the previous word past its common prefix with the next one are final, and each of
+        # them is replaced by an equivalent state already in the register (same finality and same transitions) or
+        # added to it. the register only ever holds states with minimized children, so the result is minimal.
+        # the states of the result are ints numbered in bfs order from the initial state (0).
+        transitions: list[dict[Symbol, int]] = [{}]
+        final = [False]
+        register: dict[tuple[bool, tuple[tuple[Symbol, int], ...]], int] = {}
+
+        def replace_or_register(path: list[int], previous: Sequence[Symbol], depth: int) -> None:
+            # minimize the states of 'previous' below 'depth', deepest first
+            for position in range(len(path) - 1, depth, -1):
+                state = path[position]
+                key = (final[state], tuple(transitions[state].items()))
+                registered = register.setdefault(key, state)
+                if registered != state:
+                    transitions[path[position - 1]][previous[position - 1]] = registered
+            del path[depth + 1:]
+
+        path = [0]
+        previous: Sequence[Symbol] = ''
+        for word in sorted(set(words)):
+            prefix = 0
+            while prefix < min(len(word), len(previous)) and word[prefix] == previous[prefix]:
+                prefix += 1
+
+            replace_or_register(path, previous, prefix)
+            for symbol in word[prefix:]:
+                transitions[path[-1]][symbol] = len(transitions)
+                path.append(len(transitions))
+                transitions.append({})
+                final.append(False)
+            final[path[-1]] = True
+            previous = word
+        replace_or_register(path, previous, 0)
+
+        # the states which were replaced are left behind, the result only keeps the ones reachable from 0
+        state_index = {0: 0}
+        states = [0]
+        new_d = {}
+        for state in states:
+            for symbol, next_state in transitions[state].items():
+                if next_state not in state_index:
+                    state_index[next_state] = len(states)
+                    states.append(next_state)
+                new_d[(state_index[state], symbol)] = state_index[next_state]
+
+        new_s = {symbol for (_, symbol) in new_d}
+        new_f = {state_index[state] for state in states if final[state]}
+
+        return DFA(new_s, set(range(len(states))), 0, new_d, new_f)
+
+    def accept(self, word: Iterable[Symbol]) -> bool:
+        # simulate the dfa on the given word. return true if the dfa accepts the word, false otherwise.
+        # the simulation runs on the compiled table, which is built on the first call and cached (see table)
+        return self.table().accept(word)
+
+    def accept_many(self, words: Sequence[str | bytes]) -> 'list[bool] | numpy.ndarray':
+        # accept every word of a batch. with numpy installed the result is a boolean array, see
+        # CompiledDFA.accept_many
+        return self.table().accept_many(words)
+
+    def search(self, text: Sequence[Symbol]) -> tuple[int, int] | None:
+        # the (start, end) span of the leftmost-longest match of this dfa in the text, see CompiledDFA.search
+        return self.table().search(text)
+
+    def finditer(self, text: Sequence[Symbol]) -> Iterator[tuple[int, int]]:
+        # the spans of all the non-overlapping leftmost-longest matches in the text
+        return self.table().finditer(text)
+
+    def accept_parallel(self, word: str | bytes | Shared.SharedText, processes: int | None = None) -> bool:
+        # accept, for very large words: the word is split into chunks which are simulated speculatively on a process
+        # pool and then composed (see Parallel.run_parallel). a word that does not fit in memory can be given as a
+        # file, with Shared.map_file
+        state, _ = Parallel.run_parallel(self.table(), word, processes)
+        return self.table().is_final(state)
+
+    def count_prefixes_parallel(self, word: str | bytes | Shared.SharedText, processes: int | None = None) -> int:
+        # the number of prefixes of the word (the empty one included) accepted by this dfa, computed in parallel like
+        # accept_parallel. on the unanchored dfa this is the number of positions of the word where a match ends,
+        # which is not the number of matches: the ends of overlapping matches are all counted, so a+ on 'aaa' gives
+        # 3 where finditer finds a single match.
+        _, count = Parallel.run_parallel(self.table(), word, processes)
+        return count
+
+    def count_accepted(self, length: int) -> int:
+        # the number of words of the given length accepted by this dfa, see CompiledDFA.count_accepted
+        return self.table().count_accepted(length)
+
+    def unanchored(self) -> 'DFA[int]':
+        # the dfa of the words which have a suffix accepted by this dfa (this dfa with a .* loop in front of it),
+        # built by the subset construction over the states of the compiled table. so it accepts exactly the prefixes
+        # of a text after which a match of this dfa ends. the .* loop also runs over the symbols outside the
+        # alphabet: they lead every subset back to {q0} (or wherever the other transitions of this dfa lead), so
+        # they end the runs in progress instead of the whole simulation.
+        table = self.table()
+        columns: dict[int, list[Symbol]] = {}
+        for symbol, column in table.symbols.items():
+            columns.setdefault(column, []).append(symbol)
+        if table.other is not None:
+            columns.setdefault(table.other, [])
+
+        start = frozenset({table.q0})
+        subset_index = {start: 0}
+        subsets = [start]
+        new_d = {}
+        new_other = {}
+        for state, subset in enumerate(subsets):
+            for column, symbols in columns.items():
+                next_subset = frozenset({table.table[s * table.n_columns + column] for s in subset} - {SINK}
+                                        | {table.q0})
+                if next_subset not in subset_index:
+                    subset_index[next_subset] = len(subsets)
+                    subsets.append(next_subset)
+
+                for symbol in symbols:
+                    new_d[(state, symbol)] = subset_index[next_subset]
+                if column == table.other:
+                    new_other[state] = subset_index[next_subset]
+
+            if table.other is None:
+                new_other[state] = 0
+
+        new_f = {state for state, subset in enumerate(subsets) if any(table.final[s] for s in subset)}
+
+        return DFA(set(self.S), set(range(len(subsets))), 0, new_d, new_f, new_other)
+
+    def matcher(self) -> Matcher:
+        # a streaming matcher, for words too large to be held in memory at once (see CompiledDFA.Matcher)
+        return Matcher(self.table())
+
+    def table(self) -> CompiledDFA:
+        # the cached compiled form of this dfa. it is compiled again (and the comb form dropped) when the dfa has
+        # changed since: the cache is keyed on the fields and their sizes (comparing a field to itself is
+        # immediate), so replacing a field or adding or removing a symbol, state, transition or final state is seen,
+        # but redirecting a transition in place is not (use compile for a dfa which is changed that way)
+        key = (self.S, self.K, self.d, self.F, self.other, self.q0,
+               len(self.S), len(self.K), len(self.d), len(self.F), len(self.other))
+        if self._table is None or key != self._table_key:
+            self._table = self.compile()
+            self._table_key = key
+            self._comb = None
+
+        return self._table
+
+    def save(self, path: str) -> None:
+        # store the compiled table of this dfa in a binary file. CompiledDFA.load maps it back into memory
+        self.table().save(path)
+
+    def share(self) -> Shared.SharedTable:
+        # publish the compiled table of this dfa in shared memory, for the workers of a process pool: they get the
+        # handle and attach to the table instead of unpickling a copy of the dfa (see Shared.SharedTable)
+        return Shared.share(self.table())
+
+    def compress(self, trim: bool = True) -> CombDFA:
+        # the compiled table of this dfa in the compressed comb form (see CombDFA). the form of the trimmed table is
+        # cached, like table
+        if not trim:
+            return CombDFA.from_table(self.compile(trim=False))
+
+        table = self.table()
+        if self._comb is None:
+            self._comb = CombDFA.from_table(table)
+
+        return self._comb
+
+    def table_sizes(self) -> dict[str, int]:
+        # the number of entries stored by each form of the transition function: the transition dict, the dense
+        # table and the comb form
+        table = self.table()
+        return {'dict': len(self.d), 'dense': len(table.table), 'comb': self.compress().cells()}
+
+    def to_python_source(self, name: str = 'accept') -> str:
+        # the source of a python function specialized to this dfa, which accepts the same words as accept. see
+        # CodeGen.to_python_source, and CodeGen.compile_dfa to import it. the code is generated from the minimal dfa,
+        # since every state merged away is a case less to dispatch on and can turn transitions into self-loops
+        return CodeGen.to_python_source(self.minimize().table(), name)
+
+    def numbering(self) -> list[STATE]:
+        # the states of this dfa in the order in which compile numbers them: bfs order from q0, followed by the
+        # unreachable states
+        symbols = sorted(self.S)
+        seen = {self.q0}
+        states = [self.q0]
+        for state in states:
+            for next_state in [*(self.d.get((state, symbol)) for symbol in symbols), self.other.get(state)]:
+                if next_state is not None and next_state not in seen:
+                    seen.add(next_state)
+                    states.append(next_state)
+
+        states.extend(state for state in self.K if state not in seen)
+
+        return states
+
+    def dead_states(self) -> set[STATE]:
+        # the states from which no final state can be reached (the ones which are not co-reachable)
+        predecessors: dict[STATE, list[STATE]] = {}
+        for (state, _), next_state in self.d.items():
+            predecessors.setdefault(next_state, []).append(state)
+        for state, next_state in self.other.items():
+            predecessors.setdefault(next_state, []).append(state)
+
+        alive = set(self.F)
+        queue = list(self.F)
+        for state in queue:
+            for previous_state in predecessors.get(state, []):
+                if previous_state not in alive:
+                    alive.add(previous_state)
+                    queue.append(previous_state)
+
+        return self.K - alive
+
+    def trim(self) -> 'DFA[STATE]':
+        # an equivalent dfa without dead states: the transitions into them are dropped, so they all collapse into
+        # the missing transition, on which accept rejects right away. the initial state is kept even if it is dead.
+        dead = self.dead_states()
+        new_d = {(state, symbol): next_state for (state, symbol), next_state in self.d.items()
+                 if state not in dead and next_state not in dead}
+        new_other = {state: next_state for state, next_state in self.other.items()
+                     if state not in dead and next_state not in dead}
+
+        return DFA(self.S, (self.K - dead) | {self.q0}, self.q0, new_d, set(self.F), new_other)
+
+    def compile(self, states: list[STATE] | None = None, trim: bool = True) -> CompiledDFA:
+        # renumber the states to dense ints (by default in the order given by numbering, so q0 becomes 0), map every
+        # symbol to a column and store the transition function in a flat int table. symbols which no state can tell
+        # apart (every state goes to the same state on them) are mapped to the same column, so the table has one
+        # column per class of equivalent symbols. missing transitions are stored as SINK and, unless 'trim' is
+        # false, so are the transitions into dead states, which means the simulation stops as soon as the word can
+        # no longer be accepted. the other transitions get a column of their own (or share one with the symbols that
+        # have the same targets), the column of every symbol outside the alphabet.
+        if states is None:
+            states = self.numbering()
+        dead = self.dead_states() if trim else set()
+        state_index = {state: index for index, state in enumerate(states)}
+        target_index: dict[STATE | None, int] = {state: SINK if state in dead else index
+                                                 for state, index in state_index.items()}
+
+        # the column of a symbol is identified by its targets from every state
+        classes: dict[tuple[int, ...], int] = {}
+        symbols: dict[Symbol, int] = {}
+        for symbol in sorted(self.S):
+            targets = tuple(target_index.get(self.d.get((state, symbol)), SINK) for state in states)
+            symbols[symbol] = classes.setdefault(targets, len(classes))
+
+        other = None
+        targets = tuple(target_index.get(self.other.get(state), SINK) for state in states)
+        if any(next_state != SINK for next_state in targets):
+            other = classes.setdefault(targets, len(classes))
+        n_columns = len(classes)
+
+        table = array('i', [SINK]) * (len(states) * n_columns)
+        for targets, column in classes.items():
+            for row, next_state in enumerate(targets):
+                table[row * n_columns + column] = next_state
+
+        final = bytearray(len(states))
+        for state in self.F:
+            final[state_index[state]] = 1
+
+        return CompiledDFA(symbols, len(states), n_columns, state_index[self.q0], table, final, other)
+
+    def minimize(self, key: Callable[[STATE], Hashable] | None = None,
+                 on_state: Callable[[int, STATE], None] | None = None) -> 'DFA[int]':
+        # build the minimal dfa recognizing the same language, using hopcroft's partition refinement on the
+        # compiled table. the states of the result are ints numbered in bfs order from the initial state (0).
+        # missing transitions are treated as going to an implicit sink, which only shows up in the result if some
+        # reachable state of this dfa is equivalent to it.
+        # 'key' can be used to keep apart states which accept differently (e.g. the tokens of a lexer): two states
+        # are only merged if they have the same key. the implicit sink has the key None. 'on_state' is called with
+        # every state of the result and one of the states of this dfa it was merged from.
+        states = self.numbering()
+        table = self.compile(states, trim=False)
+        sink = table.n_states
+
+        labels: list[Hashable] = [(state in self.F, None if key is None else key(state)) for state in states]
+        labels.append((False, None))
+        block = table.refine(labels)
+
+        n_columns = table.n_columns
+        columns: list[tuple[Symbol | None, int]] = sorted(table.symbols.items(), key=lambda item: item[1])
+        if table.other is not None:
+            columns.append((None, table.other))  # None stands for the other transitions
+        representative: dict[int, int] = {}
+        for state in range(table.n_states):
+            representative.setdefault(block[state], state)
+
+        state_index = {block[table.q0]: 0}
+        blocks = [block[table.q0]]
+        new_d: dict[tuple[int, Symbol], int] = {}
+        new_other: dict[int, int] = {}
+        for block_id in blocks:
+            row = representative[block_id] * n_columns
+            for symbol, column in columns:
+                next_state = table.table[row + column]
+                next_block_id = block[sink if next_state == SINK else next_state]
+                if next_block_id not in representative:
+                    continue
+
+                if next_block_id not in state_index:
+                    state_index[next_block_id] = len(blocks)
+                    blocks.append(next_block_id)
+
+                if symbol is None:
+                    new_other[state_index[block_id]] = state_index[next_block_id]
+                else:
+                    new_d[(state_index[block_id], symbol)] = state_index[next_block_id]
+
+        new_f = {state_index[block_id] for block_id in blocks if table.final[representative[block_id]]}
+
+        if on_state is not None:
+            for new_state, block_id in enumerate(blocks):
+                on_state(new_state, states[representative[block_id]])
+
+        return DFA(set(self.S), set(range(len(blocks))), 0, new_d, new_f, new_other)
+
+    def product[OTHER_STATE](self, other: 'DFA[OTHER_STATE]', operation: str) -> LazyProduct:
+        # the lazy product of the two dfas, for one of the operations in Product.OPERATIONS ('intersection',
+        # 'union', 'difference' or 'symmetric_difference'). a single scan of a word with the product answers the
+        # combined question, and only the pair states reached by the words it is run on are built.
+        return LazyProduct(self.table(), other.table(), operation)
+
+    def product_dfa[OTHER_STATE](self, other: 'DFA[OTHER_STATE]', operation: str) -> 'DFA[int]':
+        # the eager product: every reachable pair state is built and the result is a regular dfa (which can then be
+        # minimized). transitions into pairs that can no longer accept are left out.
+        product = self.product(other, operation)
+        product.explore()
+
+        new_d = {(state, product.columns[column]): next_state for (state, column), next_state
+                 in product.transitions.items() if next_state != SINK and column != product.other}
+        new_other = {state: next_state for (state, column), next_state in product.transitions.items()
+                     if next_state != SINK and column == product.other}
+        new_f = {state for state, final in enumerate(product.final) if final}
+
+        return DFA(set(product.columns), set(range(len(product.pairs))), product.q0, new_d, new_f, new_other)
+
+    def intersection[OTHER_STATE](self, other: 'DFA[OTHER_STATE]') -> 'DFA[int]':
+        return self.product_dfa(other, 'intersection')
+
+    def union[OTHER_STATE](self, other: 'DFA[OTHER_STATE]') -> 'DFA[int]':
+        return self.product_dfa(other, 'union')
+
+    def difference[OTHER_STATE](self, other: 'DFA[OTHER_STATE]') -> 'DFA[int]':
+        return self.product_dfa(other, 'difference')
+
+    def symmetric_difference[OTHER_STATE](self, other: 'DFA[OTHER_STATE]') -> 'DFA[int]':
+        return self.product_dfa(other, 'symmetric_difference')
+
+    def counterexample[OTHER_STATE](self, other: 'DFA[OTHER_STATE]') -> str | bytes | None:
+        # hopcroft and karp's equivalence check: the two dfas are simulated together in bfs order from their
+        # initial states, merging the classes of every pair of states reached on the same word in a union-find
+        # structure. a pair only needs to be followed if its states were not already in the same class, so the
+        # check takes near-linear time. returns a word accepted by exactly one of the dfas (bytes for byte-level
+        # dfas), or None if they are equivalent. if either dfa has other transitions, a symbol outside both
+        # alphabets is followed as well, standing for all of them.
+        left = self.table()
+        right = other.table()
+        columns: list[Symbol] = sorted(left.symbols.keys() | right.symbols.keys())
+        as_bytes = bool(columns) and isinstance(columns[0], int)
+        if left.other is not None or right.other is not None:
+            outside = symbol_outside(columns)
+            if outside is not None:
+                columns.append(outside)
+
+        # left states are 0..n, where n is its sink, right states follow after them
+        offset = left.n_states + 1
+        parent = list(range(offset + right.n_states + 1))
+        size = [1] * len(parent)
+
+        def find(state: int) -> int:
+            while parent[state] != state:
+                parent[state] = parent[parent[state]]
+                state = parent[state]
+
+            return state
+
+        def index(left_state: int, right_state: int) -> tuple[int, int]:
+            return (left.n_states if left_state == SINK else left_state,
+                    offset + (right.n_states if right_state == SINK else right_state))
+
+        if left.is_final(left.q0) != right.is_final(right.q0):
+            return b'' if as_bytes else ''
+
+        first, second = index(left.q0, right.q0)
+        parent[first] = second
+        size[second] += size[first]
+
+        # every queued pair remembers the symbol it was reached on and the entry of the pair it was reached from
+        trail: list[tuple[int, Symbol]] = [(-1, '')]
+        queue = deque([(left.q0, right.q0, 0)])
+        while queue:
+            left_state, right_state, entry = queue.popleft()
+
+            for symbol in columns:
+                next_left = left.step(left_state, symbol)
+                next_right = right.step(right_state, symbol)
+                first, second = map(find, index(next_left, next_right))
+                if first == second:
+                    continue
+
+                trail.append((entry, symbol))
+                if left.is_final(next_left) != right.is_final(next_right):
+                    word: list[Symbol] = []
+                    entry = len(trail) - 1
+                    while entry > 0:
+                        entry, symbol = trail[entry]
+                        word.append(symbol)
+
+                    word.reverse()
+                    return join_symbols(word)
 
-    def accept(self, word: str) -> bool:
-        # simulate the dfa on the given word. return true if the dfa accepts the word, false otherwise
-        current_state = self.q0
+                if size[first] > size[second]:
+                    first, second = second, first
+                parent[first] = second
+                size[second] += size[first]
+                queue.append((next_left, next_right, len(trail) - 1))
 
-        for i in range(len(word)):
-            if (current_state, word[i]) not in self.d:
-                return False
-            
-            current_state = self.d[(current_state, word[i])]
+        return None
 
-        return current_state in self.F
+    def equivalent[OTHER_STATE](self, other: 'DFA[OTHER_STATE]') -> bool:
+        # whether the two dfas accept the same language. see counterexample
+        return self.counterexample(other) is None
 
     def remap_states[OTHER_STATE](self, f: Callable[[STATE], 'OTHER_STATE']) -> 'DFA[OTHER_STATE]':
         # optional, but might be useful for subset construction and the lexer to avoid state name conflicts.
@@ -43,6 +474,7 @@ class DFA[STATE]:
         new_states = set([f(state) for state in self.K])
         new_d = {(f(state), symbol): f(next_state) for (state, symbol), next_state in self.d.items()}
         new_f = set([f(state) for state in self.F])
+        new_other = {f(state): f(next_state) for state, next_state in self.other.items()}
 
-        return DFA(self.S, new_states, f(self.q0), new_d, new_f)
+        return DFA(self.S, new_states, f(self.q0), new_d, new_f, new_other)
 
@@ -0,0 +1,127 @@
+from collections.abc import Iterable
+from typing import TYPE_CHECKING, Any
+
+from .CompiledDFA import SINK, Symbol, symbols_of
+
+if TYPE_CHECKING:
+    from .NFA import NFA
+
+MAX_STATES = 10000  # the default size of the cache of a lazy dfa, in states
+MIN_SYMBOLS_PER_STATE = 10  # a cache that fills up after fewer symbols than this per cached state is thrashing
+
+
+class LazyDFA:
+    # the dfa of an nfa, built on demand: a state (a subset of nfa states, as a bitset over the numbering of
+    # NFA.closures) and its transitions are only computed when the input first reaches them, and then cached, so
+    # only the part of the dfa the input actually uses is ever built. the cache holds at most max_states states:
+    # when it is full it is cleared and filled again from the current state. if that happens too often (the input
+    # keeps reaching new states) the dfa only costs time, so accept switches to simulating the nfa directly for the
+    # rest of the word.
+    def __init__(self, nfa: 'NFA[Any]', max_states: int = MAX_STATES) -> None:
+        self.nfa = nfa
+        self.max_states = max(max_states, 2)
+
+        symbol_classes = nfa.symbol_classes()
+        self.symbols = {symbol: column for column, symbol_class in enumerate(symbol_classes) for symbol in symbol_class}
+        self.columns: list[Symbol] = [symbol_class[0] for symbol_class in symbol_classes]
+
+        _, state_index, closures = nfa.closures()
+        self.start = closures[state_index[nfa.q0]]
+        self.final_bits = nfa.final_bits()
+
+        # how many times the cache was cleared, how many words were finished by simulating the nfa, and how many
+        # symbols were scanned since the cache was last cleared
+        self.clears = 0
+        self.fallbacks = 0
+        self.scanned = 0
+        self._clear()
+
+    def _clear(self) -> None:
+        self.subsets: list[int] = []
+        self.subset_index: dict[int, int] = {}
+        self.final: list[bool] = []
+        self.transitions: list[list[int | None]] = []
+        self.q0 = self._add(self.start)
+
+    def _add(self, subset: int) -> int:
+        if not subset:
+            return SINK
+
+        self.subset_index[subset] = len(self.subsets)
+        self.subsets.append(subset)
+        self.final.append(bool(subset & self.final_bits))
+        self.transitions.append([None] * len(self.columns))
+
+        return len(self.subsets) - 1
+
+    def step(self, state: int, symbol: Symbol) -> int:
+        # a single transition, computed and cached if it is not known yet. this can clear the cache, in which case
+        # the states numbered before the call are no longer valid (the state returned is)
+        column = self.symbols.get(symbol)
+        if column is None or state == SINK:
+            return SINK
+
+        next_state = self.transitions[state][column]
+        if next_state is None:
+            subset = self.nfa.step_bits(self.subsets[state], self.columns[column])
+            next_state = self.subset_index.get(subset, SINK)
+            if next_state == SINK and subset:
+                if len(self.subsets) >= self.max_states:
+                    # the state the transition starts from is gone with the cache, so it is not recorded
+                    self.clears += 1
+                    self._clear()
+                    next_state = self.subset_index.get(subset)
+                    return self._add(subset) if next_state is None else next_state
+
+                next_state = self._add(subset)
+
+            self.transitions[state][column] = next_state
+
+        return next_state
+
+    def accept(self, word: Iterable[Symbol]) -> bool:
+        symbols = self.symbols
+        transitions = self.transitions
+        state = self.q0
+        clears = self.clears
+        scanned = 0
+
+        word = iter(symbols_of(word))
+        try:
+            for symbol in word:
+                column = symbols.get(symbol)
+                if column is None:
+                    return False
+
+                next_state = transitions[state][column]
+                if next_state is None:
+                    next_state = self.step(state, symbol)
+                    if self.clears != clears:
+                        thrashing = self.scanned + scanned < self.max_states * MIN_SYMBOLS_PER_STATE
+                        self.scanned = scanned = 0
+                        if thrashing:
+                            return self._simulate(self.subsets[next_state] if next_state != SINK else 0, word)
+
+                        transitions = self.transitions
+                        clears = self.clears
+
+                if next_state == SINK:
+                    return False
+
+                state = next_state
+                scanned += 1
+
+            return self.final[state]
+        finally:
+            self.scanned += scanned
+
+    def _simulate(self, subset: int, word: Iterable[Symbol]) -> bool:
+        # finish the word by simulating the nfa from the given subset (see NFA.accept)
+        self.fallbacks += 1
+        for symbol in word:
+            if not subset:
+                return False
+
+            subset = self.nfa.step_bits(subset, symbol)
+
+        return bool(subset & self.final_bits)
@@ -1,23 +1,33 @@
+from dataclasses import dataclass
+
+from . import Shared
+from .CombDFA import CombDFA
+from .CompiledDFA import SINK
 from .DFA import DFA
 from .Regex import Regex
 from .Regex import parse_regex
 from .NFA import NFA
 
 class Lexer:
-    def __init__(self, spec: list[tuple[str, str]]) -> None:
+    def __init__(self, spec: list[tuple[str, str | DFA]], byte_level: bool = False, compressed: bool = False) -> None:
         # initialisation should convert the specification to a dfa which will be used in the lex method
         # the specification is a list of pairs (TOKEN_NAME:REGEX)
+        # a pattern can also be a dfa instead of a regex (e.g. DFA.from_words for a large list of keywords)
+        # with byte_level, the dfa reads the utf-8 encoding of the input, and lex takes bytes-like input instead of str
+        # lex runs on the dense table of the dfa, or on its comb form (see CombDFA) if compressed is set
 
         self.lexer = NFA(set(), set([0]), 0, {}, set())
-        self.tokens = {}
+        token_finals = {}
 
         i = 0
         for token, regex in spec:
-            nfa = parse_regex(regex).thompson()
+            nfa = NFA.from_dfa(regex) if isinstance(regex, DFA) else parse_regex(regex).thompson()
+            if byte_level:
+                nfa = nfa.to_bytes()
             nfa = nfa.remap_states(lambda x: x + len(self.lexer.K))
 
             value = nfa.F.pop()
-            self.tokens[value] = (token, i)
+            token_finals[value] = (token, i)
             nfa.F.add(value)
             
             self.lexer.S.update(nfa.S)
@@ -31,26 +41,68 @@ class Lexer:
 
             i += 1
 
-        self.lexer = self.lexer.subset_construction()
+        def best_token(state: frozenset[int]) -> str | None:
+            # the token with the highest priority (the one that comes first in the spec) accepted in this state
+            best = None
+            for nfa_state in state:
+                if nfa_state in token_finals and (best is None or token_finals[nfa_state][1] < best[1]):
+                    best = token_finals[nfa_state]
+
+            return None if best is None else best[0]
+
+        # the dfa states are ints, and only their tokens are kept (not the subsets of nfa states behind them)
+        dfa_tokens: list[str | None] = []
+        dfa = self.lexer.determinize(lambda state, subset: dfa_tokens.append(best_token(subset)))
+
+        # only the winning token matters when lexing, so states accepting the same token can be merged
+        self.tokens: dict[int, str] = {}
+
+        def record_token(state: int, dfa_state: int) -> None:
+            if dfa_tokens[dfa_state] is not None:
+                self.tokens[state] = dfa_tokens[dfa_state]
+
+        self.lexer = dfa.minimize(dfa_tokens.__getitem__, record_token)
+
+        # the state from which no token can be reached anymore (it is unique after minimization)
+        self.sink = None
+        for state in self.lexer.K:
+            if state not in self.tokens and all(self.lexer.d.get((state, c)) == state for c in self.lexer.S):
+                self.sink = state
+
+        # the table keeps the states of the dfa (it is complete, so SINK only stands for symbols outside its alphabet)
+        self.table = self.lexer.compile(sorted(self.lexer.K), trim=False)
+        if compressed:
+            self.table = CombDFA.from_table(self.table)
+
+    def share(self) -> 'SharedLexer':
+        # publish the table of this lexer in shared memory, for the workers of a process pool (see SharedLexer)
+        if isinstance(self.table, CombDFA):
+            raise ValueError('only lexers over the dense table can be shared')
 
+        return SharedLexer(Shared.share(self.table), self.tokens, self.sink)
 
-    def is_sink(state) -> bool:
-        return state == frozenset()
+    def is_sink(self, state: int) -> bool:
+        return state == self.sink
     
-    def is_final(tokens, state) -> bool:
-        for s in state:
-            if s in tokens.keys():
-                return True
-            
-        return False
+    def is_final(self, state: int) -> bool:
+        return state in self.tokens
 
-    def lex(self, word: str) -> list[tuple[str, str]] | None:
+    def lex(self, word: str | bytes | bytearray | memoryview) -> list[tuple[str, str | bytes]] | None:
         # this method splits the lexer into tokens based on the specification and the rules described in the lecture
         # the result is a list of tokens in the form (TOKEN_NAME:MATCHED_STRING)
-
-        curr_state = self.lexer.q0
+        # bytes-like input (for byte-level lexers) is scanned through a memoryview, without being decoded or copied.
+        # only the matched strings are copied out, as bytes, and error positions count bytes instead of characters.
+        if isinstance(word, str):
+            lexeme = str
+            newline = '\n'
+        else:
+            word = memoryview(word).cast('B')
+            lexeme = bytes
+            newline = ord('\n')
+
+        curr_state = self.table.q0
         tokens = []
-        last_token = ()
+        last_token = None
 
         character_pos = -1
         line_number = 0
@@ -60,29 +112,25 @@ class Lexer:
         last_character_pos = -1
         last_line_number = 0
         while i < len(word):
-            if Lexer.is_sink(curr_state):
-                if last_token != ():
+            if self.is_sink(curr_state):
+                if last_token is not None:
                     character_pos = last_character_pos
                     line_number = last_line_number
                     i = last_token_pos
-                    tokens.append((last_token[0], word[:i + 1]))
+                    tokens.append((last_token, lexeme(word[:i + 1])))
                     word = word[i + 1:]
                     i = -1
-                    last_token = ()
-                    curr_state = self.lexer.q0
+                    last_token = None
+                    curr_state = self.table.q0
 
                     continue
                 
                 return [("", "No viable alternative at character " + str(character_pos) + ", line " + str(line_number))]
-            elif Lexer.is_final(self.tokens, curr_state):
-                last_token = ()
-                for j in curr_state:
-                    if j in self.tokens.keys():
-                        if last_token == () or self.tokens[j][1] < last_token[1]:
-                            last_token = self.tokens[j]
-                            last_token_pos = i
-                            last_character_pos = character_pos
-                            last_line_number = line_number
+            elif self.is_final(curr_state):
+                last_token = self.tokens[curr_state]
+                last_token_pos = i
+                last_character_pos = character_pos
+                last_line_number = line_number
             elif i == len(word) - 1:
                 return [("", "No viable alternative at character EOF"+ ", line " + str(line_number))]
 
@@ -92,16 +140,46 @@ class Lexer:
             if i == len(word):
                 break
 
-            if word[i] == '\n':
+            if word[i] == newline:
                 line_number += 1
                 character_pos = -1
 
-            if (curr_state, word[i]) not in self.lexer.d:
+            next_state = self.table.step(curr_state, word[i])
+            if next_state == SINK:
                 return [("", "No viable alternative at character " + str(character_pos) + ", line " + str(line_number))]
 
-            curr_state = self.lexer.d[(curr_state, word[i])]
+            curr_state = next_state
 
-        if last_token != ():
-            tokens.append((last_token[0], word))
+        if last_token is not None:
+            tokens.append((last_token, lexeme(word)))
 
         return tokens
+
+
+@dataclass(frozen=True)
+class SharedLexer:
+    # a handle to a lexer whose table is in shared memory. besides the handle of the table it only holds the tokens
+    # of the final states, so it is cheap to send to other processes, and attach gives a lexer which lexes over the
+    # shared table. the lexer returned by attach has no dfa (its 'lexer' attribute is None), only the table.
+    table: Shared.SharedTable
+    tokens: dict[int, str]
+    sink: int | None
+
+    def attach(self) -> Lexer:
+        lexer = Lexer.__new__(Lexer)
+        lexer.lexer = None
+        lexer.tokens = self.tokens
+        lexer.sink = self.sink
+        lexer.table = self.table.attach()
+
+        return lexer
+
+    def unlink(self) -> None:
+        # free the shared table, once every process is done with it
+        self.table.unlink()
+
+    def __enter__(self) -> 'SharedLexer':
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.unlink()
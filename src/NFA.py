@@ -1,65 +1,612 @@
+from .CompiledDFA import Symbol, symbols_of
 from .DFA import DFA
+from .LazyDFA import LazyDFA, MAX_STATES
+from . import Storage
 
-from dataclasses import dataclass
-from collections.abc import Callable
+from array import array
+from bisect import bisect_left
+from functools import reduce
+from operator import or_
+from dataclasses import dataclass, field
+from collections.abc import Callable, Iterable, Iterator, Sequence
 
 EPSILON = ''  # this is how epsilon is represented by the checker in the transition function of NFAs
+NFA_KIND = b'N'
+SPARSE_STATES = 2048  # determinize keeps the subsets of nfas with more states than this as sets instead of bitsets
+
+
+def bit_indices(bits: int) -> Iterator[int]:
+    # the indices of the bits set in an int, lowest first. clearing the lowest bit at every step rewrites the whole
+    # int every time, which is cheaper than anything else for a few bits, so with many bits set the int is read once
+    # instead, as a string of binary digits
+    if bits.bit_count() <= 32:
+        while bits:
+            lowest = bits & -bits
+            yield lowest.bit_length() - 1
+            bits ^= lowest
+        return
+
+    digits = bin(bits)[:1:-1]
+    index = digits.find('1')
+    while index != -1:
+        yield index
+        index = digits.find('1', index + 1)
 
 
 @dataclass
 class NFA[STATE]:
-    S: set[str]
+    S: set[Symbol]
     K: set[STATE]
     q0: STATE
-    d: dict[tuple[STATE, str], set[STATE]]
+    d: dict[tuple[STATE, Symbol], set[STATE]]
     F: set[STATE]
 
+    _graph: tuple[list[STATE], dict[STATE, int], list[list[int]], list[list[tuple[Symbol, list[int]]]]] | None = field(
+        default=None, init=False, repr=False, compare=False)
+    _closures: tuple[list[STATE], dict[STATE, int], list[int]] | None = field(default=None, init=False, repr=False,
+                                                                              compare=False)
+    _closure_sets: list[frozenset[int]] | None = field(default=None, init=False, repr=False, compare=False)
+    _adjacency: tuple[list[dict[Symbol, int]], list[list[int]]] | None = field(default=None, init=False, repr=False,
+                                                                            compare=False)
+
     def epsilon_closure(self, state: STATE) -> set[STATE]:
         # compute the epsilon closure of a state (you will need this for subset construction)
         # see the EPSILON definition at the top of this file
-        closure = {state}
-        state_queue = [state]
+        # the closures of all the states are computed together, on the first call (see closure_sets), so the nfa
+        # should not be modified after it has been used.
+        states, state_index, _, _ = self.graph()
+        if state not in state_index:
+            return {state}
+
+        return {states[index] for index in self.closure_sets()[state_index[state]]}
+
+    def graph(self) -> tuple[list[STATE], dict[STATE, int], list[list[int]], list[list[tuple[Symbol, list[int]]]]]:
+        # the states numbered 0, 1, ... (states[i] is state i, state_index is the inverse), with the transitions
+        # indexed by state over that numbering: epsilon[i] lists the targets of the epsilon transitions of state i and
+        # targets[i] the (symbol, targets) pairs of its other transitions. computed once and cached.
+        if self._graph is not None:
+            return self._graph
+
+        states = list(self.K)
+        state_index = {state: index for index, state in enumerate(states)}
+        epsilon: list[list[int]] = [[] for _ in states]
+        targets: list[list[tuple[Symbol, list[int]]]] = [[] for _ in states]
+        for (state, symbol), next_states in self.d.items():
+            for next_state in (state, *next_states):
+                if next_state not in state_index:
+                    state_index[next_state] = len(states)
+                    states.append(next_state)
+                    epsilon.append([])
+                    targets.append([])
+
+            next_indices = [state_index[next_state] for next_state in next_states]
+            if symbol == EPSILON:
+                epsilon[state_index[state]].extend(next_indices)
+            else:
+                targets[state_index[state]].append((symbol, next_indices))
+
+        self._graph = (states, state_index, epsilon, targets)
+        return self._graph
+
+    def components(self) -> Iterator[list[int]]:
+        # the strongly connected components of the epsilon graph (from tarjan's algorithm), in reverse topological
+        # order: every component comes after the components its epsilon transitions lead to. all the states of a
+        # component have the same closure, which is its own states together with the closures of the components its
+        # epsilon transitions lead to, so the closures can be built from the components in this order.
+        epsilon = self.graph()[2]
+        order = [-1] * len(epsilon)
+        low = [0] * len(epsilon)
+        on_stack = bytearray(len(epsilon))
+        position = [0] * len(epsilon)
+        stack: list[int] = []
+        counter = 0
+        for root in range(len(epsilon)):
+            if order[root] != -1:
+                continue
+
+            order[root] = low[root] = counter
+            counter += 1
+            position[root] = len(stack)
+            stack.append(root)
+            on_stack[root] = 1
+            work = [(root, iter(epsilon[root]))]
+            while work:
+                index, successors = work[-1]
+                for next_index in successors:
+                    if order[next_index] == -1:
+                        order[next_index] = low[next_index] = counter
+                        counter += 1
+                        position[next_index] = len(stack)
+                        stack.append(next_index)
+                        on_stack[next_index] = 1
+                        work.append((next_index, iter(epsilon[next_index])))
+                        break
+                    if on_stack[next_index] and order[next_index] < low[index]:
+                        low[index] = order[next_index]
+                else:
+                    work.pop()
+                    if work and low[index] < low[work[-1][0]]:
+                        low[work[-1][0]] = low[index]
+                    if low[index] != order[index]:
+                        continue
+
+                    # index is the root of a component: its members are on the stack, above it
+                    members = stack[position[index]:]
+                    del stack[position[index]:]
+                    for member in members:
+                        on_stack[member] = 0
+                    yield members
+
+    def closures(self) -> tuple[list[STATE], dict[STATE, int], list[int]]:
+        # the epsilon closure of every state, computed once and cached. the states are numbered like in graph
+        # (states[i] is state i, state_index is the inverse) and the closure of state i is closures[i], a bitset (an
+        # int with bit j set for every state j in the closure). the closure of a component (see components) is a few
+        # ors of bitsets instead of a separate search of the graph.
+        # a bitset is as long as the highest state in it, so the closures take O(|K|^2) bits over all: for the large
+        # nfas determinize uses closure_sets instead.
+        if self._closures is not None:
+            return self._closures
+
+        states, state_index, epsilon, _ = self.graph()
+        closures = [0] * len(states)
+        for members in self.components():
+            closure = 0
+            for member in members:
+                closure |= 1 << member
+            for member in members:
+                for next_index in epsilon[member]:
+                    closure |= closures[next_index]
+            for member in members:
+                closures[member] = closure
+
+        self._closures = (states, state_index, closures)
+        return self._closures
+
+    def closure_sets(self) -> list[frozenset[int]]:
+        # the closures as sets of state indices (over the numbering of graph) instead of bitsets, computed once and
+        # cached. they take space in proportion to their sizes rather than to the number of states.
+        if self._closure_sets is not None:
+            return self._closure_sets
+
+        epsilon = self.graph()[2]
+        closures: list[frozenset[int]] = [frozenset()] * len(epsilon)
+        for members in self.components():
+            closure = set(members)
+            for member in members:
+                for next_index in epsilon[member]:
+                    closure.update(closures[next_index])
+            for member in members:
+                closures[member] = frozenset(closure)
+
+        self._closure_sets = closures
+        return self._closure_sets
+
+    def adjacency(self) -> tuple[list[dict[Symbol, int]], list[list[int]]]:
+        # the transitions indexed by state, over the numbering of closures (computed once and cached): outgoing[i] maps
+        # every symbol state i has a transition on to the states it leads to, epsilon closure included, as a bitset,
+        # and epsilon[i] lists the targets of the epsilon transitions of state i. so the transitions of a state can be
+        # followed without probing d with every symbol of the alphabet.
+        if self._adjacency is not None:
+            return self._adjacency
+
+        _, _, epsilon, targets = self.graph()
+        closures = self.closures()[2]
+        outgoing: list[dict[Symbol, int]] = []
+        for state_targets in targets:
+            state_outgoing = {}
+            for symbol, next_indices in state_targets:
+                bits = 0
+                for next_index in next_indices:
+                    bits |= closures[next_index]
+                state_outgoing[symbol] = bits
+            outgoing.append(state_outgoing)
+
+        self._adjacency = (outgoing, epsilon)
+        return self._adjacency
+
+    def states_of(self, bits: int) -> Iterator[STATE]:
+        # the states in a bitset over the numbering of closures
+        states = self.graph()[0]
+        for index in bit_indices(bits):
+            yield states[index]
+
+    def final_bits(self) -> int:
+        # the final states, as a bitset over the numbering of closures
+        state_index = self.graph()[1]
+        bits = 0
+        for state in self.F:
+            bits |= 1 << state_index[state]
+
+        return bits
+
+    def step_bits(self, active: int, symbol: Symbol) -> int:
+        # the bitset of the states reached from the states in 'active' on the symbol, epsilon closure included
+        outgoing = self.adjacency()[0]
+        next_active = 0
+        while active:
+            lowest = active & -active
+            next_active |= outgoing[lowest.bit_length() - 1].get(symbol, 0)
+            active ^= lowest
+
+        return next_active
+
+    def accept(self, word: Iterable[Symbol]) -> bool:
+        # simulate the nfa directly on the word (thompson's algorithm), without building a dfa: the set of active
+        # states is a bitset (see closures), advanced over every symbol by oring the closures of the targets of its
+        # states. so it takes O(len(word) * |K|) time and O(|K|) memory for any nfa, even one whose dfa would be
+        # exponentially large.
+        _, state_index, closures = self.closures()
+        active = closures[state_index[self.q0]]
+        for symbol in symbols_of(word):
+            active = self.step_bits(active, symbol)
+            if not active:
+                return False
+
+        return bool(active & self.final_bits())
+
+    def lazy(self, max_states: int = MAX_STATES) -> LazyDFA:
+        # the dfa of this nfa, built on demand as words are accepted, with a cache of at most max_states states (see
+        # LazyDFA). an alternative to subset_construction when the full dfa is too large
+        return LazyDFA(self, max_states)
+
+    def search(self, text: Sequence[Symbol], start: int = 0) -> tuple[int, int] | None:
+        # the leftmost-longest match in text[start:], as a (start, end) span, or None, like CompiledDFA.search but
+        # simulating the nfa. a run is started at every position, and the active states are kept in groups by the
+        # position their run started at, earliest first. every state belongs to the group of the earliest run that
+        # reached it, so the groups stay disjoint and a step costs O(|K|) no matter how many runs there are.
+        _, state_index, closures = self.closures()
+        q0_bits = closures[state_index[self.q0]]
+        final = self.final_bits()
+
+        groups: list[tuple[int, int]] = []
+        best: tuple[int, int] | None = None
+        position = start
+        while True:
+            if best is None:
+                reached = 0
+                for _, active in groups:
+                    reached |= active
+                if q0_bits & ~reached:
+                    groups.append((position, q0_bits & ~reached))
+
+            for run_start, active in groups:
+                if active & final and (best is None or run_start < best[0]
+                                       or (run_start == best[0] and position > best[1])):
+                    best = (run_start, position)
+                    break
+
+            if best is not None:
+                groups = [(run_start, active) for run_start, active in groups if run_start <= best[0]]
+                if not groups:
+                    break
+
+            if position == len(text):
+                break
+
+            next_groups: list[tuple[int, int]] = []
+            reached = 0
+            for run_start, active in groups:
+                next_active = self.step_bits(active, text[position]) & ~reached
+                if next_active:
+                    next_groups.append((run_start, next_active))
+                    reached |= next_active
+
+            groups = next_groups
+            position += 1
+
+        return best
+
+    def finditer(self, text: Sequence[Symbol]) -> Iterator[tuple[int, int]]:
+        # the spans of all the non-overlapping leftmost-longest matches in the text, in a single pass like
+        # CompiledDFA.finditer: the groups of the runs of the searches after the current match are carried along
+        # with the others, and a state belongs to the group of the earliest run that reached it, whatever its search.
+        _, state_index, closures = self.closures()
+        q0_bits = closures[state_index[self.q0]]
+        final = self.final_bits()
+
+        groups: list[tuple[int, int]] = []
+        matches: list[tuple[int, int]] = []
+        done = 0
+        next_start = 0
+        position = 0
+        while True:
+            while True:
+                if position >= next_start:
+                    reached = 0
+                    for _, active in groups:
+                        reached |= active
+                    if q0_bits & ~reached:
+                        groups.append((position, q0_bits & ~reached))
+
+                # the groups are in the order of their starts, so the first one that improves the match of its search
+                # is the best
+                best: tuple[int, int] | None = None
+                for run_start, active in groups:
+                    if active & final:
+                        search = bisect_left(matches, (run_start,), done)
+                        if search == len(matches) or run_start < matches[search][0] or position > matches[search][1]:
+                            best = (run_start, search)
+                            break
+                if best is None and position >= next_start and q0_bits & final:
+                    # the final states of the run started here belong to an earlier group, see CompiledDFA.finditer
+                    best = (position, len(matches))
 
-        while state_queue:
-            curr_state = state_queue.pop()
+                if best is None:
+                    break
 
-            for next_state in self.d.get((curr_state, EPSILON), []):
-                if next_state not in closure:
-                    state_queue.append(next_state)
-                    closure.add(next_state)
+                run_start, search = best
+                del matches[search:]
+                matches.append((run_start, position))
+                next_start = position if position > run_start else position + 1
+                groups = [(start, active) for start, active in groups if start <= run_start]
 
-        return closure
+            if done < len(matches):
+                first_start = groups[0][0] if groups else len(text) + 1
+                while done < len(matches) and matches[done][0] < first_start:
+                    yield matches[done]
+                    done += 1
+                if done > 1024 and 2 * done > len(matches):
+                    del matches[:done]
+                    done = 0
+
+            if position == len(text):
+                break
+
+            symbol = text[position]
+            next_groups: list[tuple[int, int]] = []
+            reached = 0
+            for run_start, active in groups:
+                next_active = self.step_bits(active, symbol) & ~reached
+                if next_active:
+                    next_groups.append((run_start, next_active))
+                    reached |= next_active
+
+            groups = next_groups
+            position += 1
+
+        yield from matches[done:]
+
+    def symbol_classes(self) -> list[list[Symbol]]:
+        # group the symbols of the alphabet which no state can tell apart: two symbols are in the same class if every
+        # state has the same targets on both of them (like the letters of [a-z] in most regexes)
+        transitions: dict[Symbol, set[tuple[STATE, frozenset[STATE]]]] = {symbol: set() for symbol in self.S}
+        for (state, symbol), next_states in self.d.items():
+            if symbol in transitions:
+                transitions[symbol].add((state, frozenset(next_states)))
+
+        classes: dict[frozenset[tuple[STATE, frozenset[STATE]]], list[Symbol]] = {}
+        for symbol in sorted(self.S):
+            classes.setdefault(frozenset(transitions[symbol]), []).append(symbol)
+
+        return list(classes.values())
 
     def subset_construction(self) -> DFA[frozenset[STATE]]:
         # convert this nfa to a dfa using the subset construction algorithm
-        dfa_q0 = frozenset(self.epsilon_closure(self.q0))
-        dfa_k = {dfa_q0}
-        dfa_d = dict()
+        subsets: list[frozenset[STATE]] = []
+        dfa = self.determinize(lambda dfa_state, subset: subsets.append(subset))
+
+        return dfa.remap_states(subsets.__getitem__)
+
+    def determinize(self, on_state: Callable[[int, frozenset[STATE]], None] | None = None) -> DFA[int]:
+        # the subset construction, with the dfa states numbered 0, 1, ... in bfs order from the initial state. the
+        # subsets of nfa states are only kept while the dfa is being built: 'on_state' is called with every new dfa
+        # state and its subset (in increasing order of the dfa states), for callers which need to know something
+        # about them (like the tokens accepted in each state of a lexer).
+        # the symbols of a class (see symbol_classes) lead to the same subset, so it is only computed once per class.
+        # the subsets are bitsets over the numbering of closures (python ints), so building the subset reached on a
+        # class is an or of the precomputed closures of the targets, and interning it hashes a single int. a subset
+        # is only turned into a frozenset of states for 'on_state'. the subsets reached on all the classes are built
+        # together, by following only the transitions the states of the subset actually have (see graph), so the work
+        # is proportional to the number of transitions rather than to the size of the alphabet.
+        # a bitset costs time in proportion to the number of nfa states however, even for a subset of a few states
+        # (like the subsets of a lexer over a large list of keywords), so above SPARSE_STATES states the subsets are
+        # frozensets of state indices instead, built from closure_sets.
+        states, state_index, _, _ = self.graph()
+        if len(states) > SPARSE_STATES:
+            final = frozenset(state_index[state] for state in self.F)
+            return self._determinize(self.closure_sets(), final, frozenset(), iter, on_state)
+
+        return self._determinize(self.closures()[2], self.final_bits(), 0, bit_indices, on_state)
+
+    def _determinize[SUBSET: (int, frozenset[int])](
+            self, closures: Sequence[SUBSET], final: SUBSET, empty: SUBSET,
+            members_of: Callable[[SUBSET], Iterable[int]],
+            on_state: Callable[[int, frozenset[STATE]], None] | None) -> DFA[int]:
+        # the subset construction of determinize, over subsets of one kind: bitsets, or frozensets of state indices
+        symbol_classes = self.symbol_classes()
+        columns = {symbol: column for column, symbol_class in enumerate(symbol_classes) for symbol in symbol_class}
+        states, state_index, _, targets = self.graph()
+
+        # the transitions of every nfa state by class instead of by symbol, built the first time the state is reached
+        class_edges: dict[int, list[tuple[int, SUBSET]]] = {}
+
+        dfa_q0 = closures[state_index[self.q0]]
+        subset_index = {dfa_q0: 0}
+        subsets = [dfa_q0]
+        dfa_d: dict[tuple[int, Symbol], int] = {}
+        dfa_f: set[int] = set()
+
+        for dfa_curr_state, subset in enumerate(subsets):
+            members = members_of(subset)
+            if on_state is not None:
+                members = list(members)
+                on_state(dfa_curr_state, frozenset(states[index] for index in members))
+            if subset & final:
+                dfa_f.add(dfa_curr_state)
+
+            next_subsets = [empty] * len(symbol_classes)
+            for nfa_state in members:
+                edges = class_edges.get(nfa_state)
+                if edges is None:
+                    # the symbols of a class have the same targets, so any of them gives the targets of the class
+                    class_targets = {columns[symbol]: next_indices for symbol, next_indices in targets[nfa_state]
+                                     if symbol in columns}
+                    edges = class_edges[nfa_state] = [
+                        (column, reduce(or_, map(closures.__getitem__, next_indices), empty))
+                        for column, next_indices in class_targets.items()]
+
+                for column, next_bits in edges:
+                    next_subsets[column] |= next_bits
+
+            for symbol_class, next_subset in zip(symbol_classes, next_subsets):
+                if next_subset not in subset_index:
+                    subset_index[next_subset] = len(subsets)
+                    subsets.append(next_subset)
+
+                for ltr in symbol_class:
+                    dfa_d[(dfa_curr_state, ltr)] = subset_index[next_subset]
+
+        return DFA(self.S, set(range(len(subsets))), 0, dfa_d, dfa_f)
 
-        dfa_state_q = [dfa_q0]
-        while dfa_state_q:
-            dfa_curr_state = dfa_state_q.pop()
+    @staticmethod
+    def from_dfa[DFA_STATE](dfa: DFA[DFA_STATE]) -> 'NFA[int]':
+        # the dfa as an nfa with int states (numbered like DFA.numbering, so q0 is 0) and a single final state,
+        # reached by epsilon transitions from the final states of the dfa. this is the shape thompson's construction
+        # gives, so dfas built without regexes (like DFA.from_words) can be combined with the nfas of regexes.
+        # nfas have no transitions on the symbols outside their alphabet, so a dfa with other transitions (like
+        # the unanchored dfas) cannot be converted.
+        if dfa.other:
+            raise ValueError('a dfa with transitions on the symbols outside its alphabet has no equivalent nfa')
 
-            for ltr in self.S:
-                dfa_next_state = set()
+        state_index = {state: index for index, state in enumerate(dfa.numbering())}
+        final = len(state_index)
 
-                for nfa_state in dfa_curr_state:
-                    nfa_next_states = self.d.get((nfa_state, ltr), set())
+        d: dict[tuple[int, Symbol], set[int]] = {}
+        for (state, symbol), next_state in dfa.d.items():
+            d[(state_index[state], symbol)] = {state_index[next_state]}
+        for state in dfa.F:
+            d[(state_index[state], EPSILON)] = {final}
+
+        return NFA(set(dfa.S), set(range(final + 1)), state_index[dfa.q0], d, {final})
+
+    def remove_epsilons(self) -> 'NFA[STATE]':
+        # an equivalent nfa without epsilon transitions: a state gets the transitions of every state in its closure
+        # (to the same targets, not to their closures) and is final if its closure holds a final state. only the
+        # states reached by a symbol are needed besides q0 (the others were only ever passed through), and of those
+        # only the ones from which a final state can still be reached, so the result is usually much smaller.
+        _, state_index, closures = self.closures()
+        final = self.final_bits()
+
+        outgoing: dict[STATE, list[tuple[Symbol, set[STATE]]]] = {}
+        for (state, symbol), next_states in self.d.items():
+            if symbol != EPSILON:
+                outgoing.setdefault(state, []).append((symbol, next_states))
+
+        states = [self.q0]
+        seen = {self.q0}
+        new_d: dict[tuple[STATE, Symbol], set[STATE]] = {}
+        new_f = set()
+        for state in states:
+            closure = closures[state_index[state]]
+            if closure & final:
+                new_f.add(state)
+
+            for member in self.states_of(closure):
+                for symbol, next_states in outgoing.get(member, ()):
+                    new_d.setdefault((state, symbol), set()).update(next_states)
+                    for next_state in next_states:
+                        if next_state not in seen:
+                            seen.add(next_state)
+                            states.append(next_state)
+
+        # drop the states from which no final state can be reached
+        predecessors: dict[STATE, list[STATE]] = {}
+        for (state, _), next_states in new_d.items():
+            for next_state in next_states:
+                predecessors.setdefault(next_state, []).append(state)
+
+        alive = set(new_f)
+        queue = list(new_f)
+        for state in queue:
+            for previous_state in predecessors.get(state, ()):
+                if previous_state not in alive:
+                    alive.add(previous_state)
+                    queue.append(previous_state)
+
+        new_d = {(state, symbol): next_states & alive for (state, symbol), next_states in new_d.items()
+                 if state in alive and not next_states.isdisjoint(alive)}
+
+        return NFA(set(self.S), alive | {self.q0}, self.q0, new_d, new_f)
+
+    def to_bytes(self) -> 'NFA[int]':
+        # an equivalent nfa over bytes (the ints 0..255): it accepts the utf-8 encodings of the words this nfa
+        # accepts, so the dfa built from it runs directly on bytes, bytearray or memoryview input. a symbol encoded on
+        # more than one byte gets a chain of new states, shared by the symbols with a common prefix. symbols which are
+        # already bytes (ints) are kept.
+        state_index = {state: index for index, state in enumerate(self.K)}
+        n_states = len(state_index)
+        chains: dict[tuple[int, bytes], int] = {}
+        new_d: dict[tuple[int, Symbol], set[int]] = {}
+
+        for (state, symbol), next_states in self.d.items():
+            targets = {state_index[next_state] for next_state in next_states}
+            if symbol == EPSILON:
+                new_d.setdefault((state_index[state], EPSILON), set()).update(targets)
+                continue
+
+            encoded = bytes([symbol]) if isinstance(symbol, int) else symbol.encode('utf-8')
+            current_state = state_index[state]
+            for length in range(1, len(encoded)):
+                key = (state_index[state], encoded[:length])
+                if key not in chains:
+                    chains[key] = n_states
+                    n_states += 1
+                    new_d.setdefault((current_state, encoded[length - 1]), set()).add(chains[key])
+                current_state = chains[key]
+
+            new_d.setdefault((current_state, encoded[-1]), set()).update(targets)
+
+        new_s: set[Symbol] = {byte for symbol in self.S
+                              for byte in ([symbol] if isinstance(symbol, int) else symbol.encode('utf-8'))}
+        new_f = {state_index[state] for state in self.F}
+
+        return NFA(new_s, set(range(n_states)), state_index[self.q0], new_d, new_f)
+
+    def save(self, path: str) -> None:
+        # store this nfa in the binary format described in Storage. the states are renumbered to ints (q0 becomes 0)
+        # and the symbols to columns (S in sorted order, followed by epsilon). the transitions are stored as
+        # compressed rows: the targets of state s on column c are targets[offsets[i]:offsets[i + 1]], where
+        # i = s * (len(S) + 1) + c.
+        states = [self.q0, *(state for state in self.K if state != self.q0)]
+        state_index = {state: index for index, state in enumerate(states)}
+        symbols = sorted(self.S)
+        columns = {symbol: column for column, symbol in enumerate(symbols)}
+        columns[EPSILON] = len(symbols)
+        width = len(symbols) + 1
+
+        rows = {}
+        for (state, symbol), next_states in self.d.items():
+            rows[state_index[state] * width + columns[symbol]] = sorted(state_index[s] for s in next_states)
 
-                    for nfa_next_state in nfa_next_states:
-                        dfa_next_state.update(self.epsilon_closure(nfa_next_state))
+        offsets = array('i', [0])
+        targets = array('i')
+        for row in range(len(states) * width):
+            targets.extend(rows.get(row, []))
+            offsets.append(len(targets))
 
-                dfa_next_state = frozenset(dfa_next_state)
+        final = bytearray(len(states))
+        for state in self.F:
+            final[state_index[state]] = 1
 
-                if dfa_next_state not in dfa_k:
-                    dfa_k.add(dfa_next_state)
-                    dfa_state_q.append(dfa_next_state)
+        Storage.dump(path, NFA_KIND, [len(states), len(symbols)], symbols, [offsets, targets, final])
 
-                dfa_d[(dfa_curr_state, ltr)] = dfa_next_state
+    @staticmethod
+    def load(path: str) -> 'NFA[int]':
+        # load an nfa stored by save. its states are the ints assigned by save
+        (n_states, n_symbols), symbols, (offsets, targets, final) = Storage.load(path, NFA_KIND)
+        offsets = offsets.cast('i')
+        targets = targets.cast('i')
+        width = n_symbols + 1
+        if len(offsets) != n_states * width + 1 or len(final) != n_states or len(symbols) != n_symbols:
+            raise ValueError(f'{path} is truncated')
 
-        dfa_f = {dfa_state for dfa_state in dfa_k if dfa_state.intersection(self.F)}
+        columns = [*symbols, EPSILON]
+        d = {}
+        for row in range(n_states * width):
+            if offsets[row] != offsets[row + 1]:
+                d[(row // width, columns[row % width])] = set(targets[offsets[row]:offsets[row + 1]])
 
-        return DFA(self.S, dfa_k, dfa_q0, dfa_d, dfa_f)
+        return NFA(set(symbols), set(range(n_states)), 0, d, {state for state in range(n_states) if final[state]})
 
     def remap_states[OTHER_STATE](self, f: 'Callable[[STATE], OTHER_STATE]') -> 'NFA[OTHER_STATE]':
         # optional, but may be useful for the second stage of the project. Works similarly to 'remap_states'
@@ -0,0 +1,142 @@
+import multiprocessing
+import multiprocessing.pool
+import os
+from collections.abc import Sequence
+from itertools import islice
+
+from . import Shared
+from .CompiledDFA import CompiledDFA, SINK, Symbol
+
+
+def run_from_states(table: CompiledDFA, chunk: Sequence[Symbol],
+                    starts: list[int]) -> tuple[list[int], list[int]]:
+    # simulate the chunk from every state in 'starts' at once. returns, for every start state, the state it stops in
+    # and the number of nonempty prefixes of the chunk after which it was in a final state. runs that reach the
+    # same state are merged, since they behave the same from then on, so the work quickly drops to that of a single
+    # run. the count of a run is the count of its group plus its own offset, so merging only moves the offsets of
+    # the smaller group.
+    symbols = table.symbols
+    transitions = table.table
+    n_columns = table.n_columns
+    final = table.final
+    other = table.other
+
+    ends = [SINK] * len(starts)
+    offsets = [0] * len(starts)
+    groups: dict[int, tuple[list[int], int]] = {}
+    for index, state in enumerate(starts):
+        if state != SINK:
+            groups.setdefault(state, ([], 0))[0].append(index)
+
+    position = 0
+    while len(groups) > 1 and position < len(chunk):
+        column = symbols.get(chunk[position], other)
+        position += 1
+        next_groups: dict[int, tuple[list[int], int]] = {}
+        for state, (members, count) in groups.items():
+            next_state = SINK if column is None else transitions[state * n_columns + column]
+            if next_state == SINK:
+                for index in members:
+                    offsets[index] += count
+                continue
+
+            count += final[next_state]
+            if next_state in next_groups:
+                other_members, other_count = next_groups[next_state]
+                if len(other_members) < len(members):
+                    members, count, other_members, other_count = other_members, other_count, members, count
+
+                for index in members:
+                    offsets[index] += count - other_count
+                other_members.extend(members)
+                members, count = other_members, other_count
+
+            next_groups[next_state] = (members, count)
+        groups = next_groups
+
+    if len(groups) == 1:
+        # all the runs merged, the rest of the chunk is a plain simulation
+        ((state, (members, count)),) = groups.items()
+        for symbol in islice(chunk, position, None):
+            column = symbols.get(symbol, other)
+            state = SINK if column is None else transitions[state * n_columns + column]
+            if state == SINK:
+                for index in members:
+                    offsets[index] += count
+                return ends, offsets
+
+            count += final[state]
+        groups = {state: (members, count)}
+
+    for state, (members, count) in groups.items():
+        for index in members:
+            ends[index] = state
+            offsets[index] += count
+
+    return ends, offsets
+
+
+def run_shared(handle: Shared.SharedTable, text: Shared.SharedText, start: int, end: int,
+               starts: list[int]) -> tuple[list[int], list[int]]:
+    # run_from_states on text[start:end], for the workers of run_parallel: the table and the text are both read in
+    # place from their mappings. the blocks only live for one call of run_parallel, so the worker detaches from them
+    # right away
+    chunk = text.read(start, end)
+    try:
+        return run_from_states(handle.attach(), chunk, starts)
+    finally:
+        if isinstance(chunk, memoryview):
+            chunk.release()
+        text.detach()
+        handle.detach()
+
+
+def run_parallel(table: CompiledDFA, text: str | bytes | Shared.SharedText, processes: int | None = None,
+                 pool: multiprocessing.pool.Pool | None = None) -> tuple[int, int]:
+    # simulate the table on the text, split into one chunk per process. the first chunk is run from q0, every other
+    # one speculatively from all the states it could start in: the targets of the transitions on the last symbol of
+    # the chunk before it. the per-chunk mappings are then composed in order. returns the state the text ends in
+    # and the number of prefixes of the text (the empty one included) which are accepted.
+    # 'processes' is the number of chunks (by default one per cpu). 'pool' can be an existing process pool,
+    # otherwise one with that many workers is started for the call. neither the table nor the text is pickled or
+    # split here: the workers get shared memory handles (see Shared) and the (start, end) offsets of their chunk,
+    # and read it in place. a str or bytes text is published in shared memory for the call, a Shared.SharedText
+    # (e.g. a file mapped by Shared.map_file, which this process never reads) is used as it is.
+    owned = not isinstance(text, Shared.SharedText)
+    shared_text = text if isinstance(text, Shared.SharedText) else Shared.share_text(text)
+
+    processes = processes or os.cpu_count() or 1
+    size = max(1, -(-len(text) // processes))
+    all_states = range(table.n_states)
+    try:
+        with Shared.share(table) as handle:
+            tasks = []
+            for start in range(0, len(text), size):
+                if start == 0:
+                    starts = [table.q0]
+                else:
+                    previous_symbol = shared_text.read(start - 1, start)[0]
+                    starts = sorted({table.step(state, previous_symbol) for state in all_states} - {SINK})
+                tasks.append((handle, shared_text, start, min(start + size, len(text)), starts))
+            shared_text.detach()
+
+            if pool is not None:
+                results = pool.starmap(run_shared, tasks)
+            else:
+                with multiprocessing.Pool(processes) as new_pool:
+                    results = new_pool.starmap(run_shared, tasks)
+    finally:
+        if owned:
+            shared_text.unlink()
+
+    state = table.q0
+    count = int(table.is_final(table.q0))
+    for (*_, starts), (ends, counts) in zip(tasks, results):
+        if state == SINK:
+            break
+
+        index = starts.index(state)
+        state = ends[index]
+        count += counts[index]
+
+    return state, count
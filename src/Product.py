@@ -0,0 +1,101 @@
+from collections.abc import Callable, Iterable
+
+from .CompiledDFA import CompiledDFA, SINK, Symbol, symbol_outside, symbols_of
+
+# how the acceptance of the two dfas is combined by every product operation
+OPERATIONS: dict[str, Callable[[bool, bool], bool]] = {
+    'intersection': lambda left, right: left and right,
+    'union': lambda left, right: left or right,
+    'difference': lambda left, right: left and not right,
+    'symmetric_difference': lambda left, right: left != right,
+}
+
+
+class LazyProduct:
+    # the product automaton of two compiled dfas. its states are pairs of states of the two dfas (SINK standing for a
+    # missing transition), numbered in the order in which they are first reached, and only the pairs the input
+    # actually reaches are ever built. a pair from which no word can be accepted anymore is replaced by SINK, so
+    # simulation stops as soon as the result is decided. if either dfa has transitions on the symbols outside its
+    # alphabet (see DFA.other), the symbols outside both alphabets get a column too, 'other', which comes after
+    # the columns of the symbols and is stepped with one of them.
+    def __init__(self, left: CompiledDFA, right: CompiledDFA, operation: str) -> None:
+        self.left = left
+        self.right = right
+        self.operation = OPERATIONS[operation]
+
+        self.columns: list[Symbol] = sorted(left.symbols.keys() | right.symbols.keys())
+        self.symbols = {symbol: column for column, symbol in enumerate(self.columns)}
+        self.other: int | None = None
+        self.other_symbol: Symbol | None = None
+        if left.other is not None or right.other is not None:
+            self.other_symbol = symbol_outside(self.columns)
+            if self.other_symbol is not None:
+                self.other = len(self.columns)
+        self.pairs: list[tuple[int, int]] = []
+        self.pair_index: dict[tuple[int, int], int] = {}
+        self.final: list[bool] = []
+        self.transitions: dict[tuple[int, int], int] = {}
+
+        self.q0 = self._add((left.q0, right.q0))
+
+    def _add(self, pair: tuple[int, int]) -> int:
+        self.pair_index[pair] = len(self.pairs)
+        self.pairs.append(pair)
+        self.final.append(self.operation(self.left.is_final(pair[0]), self.right.is_final(pair[1])))
+
+        return len(self.pairs) - 1
+
+    def _is_dead(self, pair: tuple[int, int]) -> bool:
+        # a sink can only stay rejecting, any other state is assumed to be able to go either way
+        left = [False] if pair[0] == SINK else [False, True]
+        right = [False] if pair[1] == SINK else [False, True]
+
+        return not any(self.operation(x, y) for x in left for y in right)
+
+    def step(self, state: int, symbol: Symbol) -> int:
+        column = self.symbols.get(symbol, self.other)
+        if column is None or state == SINK:
+            return SINK
+
+        next_state = self.transitions.get((state, column))
+        if next_state is None:
+            left, right = self.pairs[state]
+            pair = (self.left.step(left, symbol), self.right.step(right, symbol))
+
+            if pair in self.pair_index:
+                next_state = self.pair_index[pair]
+            elif self._is_dead(pair):
+                next_state = SINK
+            else:
+                next_state = self._add(pair)
+
+            self.transitions[(state, column)] = next_state
+
+        return next_state
+
+    def accept(self, word: Iterable[Symbol]) -> bool:
+        symbols = self.symbols
+        transitions = self.transitions
+        other = self.other
+        state = self.q0
+
+        for symbol in symbols_of(word):
+            column = symbols.get(symbol, other)
+            if column is None:
+                return False
+
+            next_state = transitions.get((state, column))
+            state = self.step(state, symbol) if next_state is None else next_state
+            if state == SINK:
+                return False
+
+        return self.final[state]
+
+    def explore(self) -> None:
+        # build every reachable pair (the eager product)
+        symbols = self.columns if self.other_symbol is None else [*self.columns, self.other_symbol]
+        state = 0
+        while state < len(self.pairs):
+            for symbol in symbols:
+                self.step(state, symbol)
+            state += 1
@@ -1,3 +1,4 @@
+from .CompiledDFA import Symbol
 from .NFA import NFA
 from dataclasses import dataclass
 
@@ -128,8 +129,8 @@ class Char(Regex):
 @dataclass
 class BigLetters(Regex):
     def thompson(self) -> NFA[int]:
-        S = {chr(i) for i in range(ord('A'), ord('Z') + 1)}
-        d = {(int(0), chr(i)) : {1} for i in range(ord('A'), ord('Z') + 1)}
+        S: set[Symbol] = {chr(i) for i in range(ord('A'), ord('Z') + 1)}
+        d: dict[tuple[int, Symbol], set[int]] = {(int(0), chr(i)) : {1} for i in range(ord('A'), ord('Z') + 1)}
         d[(int(1), '')] = {2}
 
         return NFA(S, {0, 1, 2}, 0, d, {2})
@@ -138,8 +139,8 @@ class BigLetters(Regex):
 @dataclass
 class SmallLetters(Regex):
     def thompson(self) -> NFA[int]:
-        S = {chr(i) for i in range(ord('a'), ord('z') + 1)}
-        d = {(int(0), chr(i)) : {1} for i in range(ord('a'), ord('z') + 1)}
+        S: set[Symbol] = {chr(i) for i in range(ord('a'), ord('z') + 1)}
+        d: dict[tuple[int, Symbol], set[int]] = {(int(0), chr(i)) : {1} for i in range(ord('a'), ord('z') + 1)}
         d[(int(1), '')] = {2}
 
         return NFA(S, {0, 1, 2}, 0, d, {2})
@@ -147,8 +148,8 @@ class SmallLetters(Regex):
 @dataclass
 class Numbers(Regex):
     def thompson(self) -> NFA[int]:
-        S = {chr(i) for i in range(ord('0'), ord('9') + 1)}
-        d = {(int(0), chr(i)) : {1} for i in range(ord('0'), ord('9') + 1)}
+        S: set[Symbol] = {chr(i) for i in range(ord('0'), ord('9') + 1)}
+        d: dict[tuple[int, Symbol], set[int]] = {(int(0), chr(i)) : {1} for i in range(ord('0'), ord('9') + 1)}
         d[(int(1), '')] = {2}
 
         return NFA(S, {0, 1, 2}, 0, d, {2})
@@ -0,0 +1,214 @@
+import mmap
+import os
+import sys
+from dataclasses import dataclass
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+from .CompiledDFA import CompiledDFA
+
+# the blocks published by this process, and the tables attached by it (with the blocks they are views into, which
+# have to stay open as long as the tables are used). a process attaches to every block at most once.
+_published: dict[str, SharedMemory] = {}
+_attached: dict[str, tuple[SharedMemory, CompiledDFA]] = {}
+_texts: dict[str, tuple[SharedMemory | mmap.mmap, memoryview]] = {}  # the texts mapped by this process
+_lingering: list[SharedMemory | mmap.mmap] = []  # blocks which could not be closed because some view is still alive
+
+TEXT_PIECE = 1 << 20  # a str is encoded into shared memory this many characters at a time
+# the encoding of a shared str by its width in bytes per character, so character i of the str is at offset width * i
+TEXT_ENCODINGS = {1: 'latin-1', 2: 'utf-16-le', 4: 'utf-32-le'}
+
+# the blocks are freed explicitly, by unlink, and kept away from the resource tracker, which would otherwise free a
+# block as soon as any worker which attached to it exits. python 3.13 has track=False for this, before it the block
+# is unregistered by hand (only posix has a resource tracker)
+_TRACKED = sys.version_info < (3, 13) and os.name == 'posix'
+
+
+@dataclass(frozen=True)
+class SharedTable:
+    # a handle to a compiled dfa published in shared memory by share. the handle only holds the name of the block,
+    # so it is cheap to send to other processes (e.g. as an argument of a pool task), and attach gives a table whose
+    # transitions are read in place from the block, with nothing copied or unpickled. the process which published
+    # the table owns the block: unlink (or leaving a with block) frees it once the workers are done.
+    name: str
+
+    def attach(self) -> CompiledDFA:
+        # the shared table, mapped into this process the first time it is attached here
+        if self.name not in _attached:
+            memory = _open(self.name)
+            _attached[self.name] = (memory, CompiledDFA.from_buffer(_view(memory), f'shared memory block {self.name}'))
+
+        return _attached[self.name][1]
+
+    def detach(self) -> None:
+        # unmap the block from this process. the table attached to it here must not be used anymore
+        if self.name in _attached:
+            _close(_attached.pop(self.name)[0])
+
+    def unlink(self) -> None:
+        # free the block, once every process is done with it
+        self.detach()
+        _unlink(_published.pop(self.name) if self.name in _published else _open(self.name))
+
+    def __enter__(self) -> 'SharedTable':
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.unlink()
+
+
+@dataclass(frozen=True)
+class SharedText:
+    # a handle to a text which the workers of a process pool read in place: a text published in shared memory by
+    # share_text, or a file mapped by map_file. like SharedTable, the handle is only a name, so a task can get the
+    # whole text and the (start, end) offsets of its part instead of a pickled copy of that part, and the part is
+    # read straight from the mapping. a str is stored in the narrowest of TEXT_ENCODINGS which holds all of its
+    # characters (width is its number of bytes per character, 0 for bytes), bytes and files as they are.
+    name: str
+    length: int
+    width: int = 0
+    is_file: bool = False
+
+    def __len__(self) -> int:
+        return self.length
+
+    def read(self, start: int, end: int) -> str | memoryview:
+        # the symbols start..end of the text: a str, or for bytes a view into the mapping, which has to be released
+        # before the text is detached
+        if self.name not in _texts:
+            if self.is_file:
+                with open(self.name, 'rb') as f:
+                    mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                _texts[self.name] = (mapping, memoryview(mapping))
+            else:
+                memory = _open(self.name)
+                _texts[self.name] = (memory, _view(memory))
+
+        view = _texts[self.name][1]
+        if self.width:
+            return str(view[self.width * start:self.width * end], TEXT_ENCODINGS[self.width], 'surrogatepass')
+
+        return view[start:end]
+
+    def detach(self) -> None:
+        # unmap the text from this process
+        if self.name in _texts:
+            mapping, view = _texts.pop(self.name)
+            if self.is_file:
+                view.release()
+            _close(mapping)
+
+    def unlink(self) -> None:
+        # free the block of a text published by share_text, once every process is done with it. a mapped file is
+        # only unmapped, it belongs to whoever wrote it
+        self.detach()
+        if not self.is_file:
+            _unlink(_published.pop(self.name) if self.name in _published else _open(self.name))
+
+    def __enter__(self) -> 'SharedText':
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.unlink()
+
+
+def _open(name: str | None = None, size: int = 0) -> SharedMemory:
+    # attach to the block with the given name, or create a new one of the given size
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name, create=name is None, size=size, track=False)
+
+    memory = SharedMemory(name, create=name is None, size=size)
+    if _TRACKED:
+        # the registration is dropped right away. a worker of a pool which shares the resource tracker of this
+        # process may attach to a block at the same time as another one, and the tracker only keeps one registration
+        # of the block, so the second unregister finds nothing: the tracker prints the KeyError and goes on
+        resource_tracker.unregister(memory._name, 'shared_memory')  # type: ignore[attr-defined]
+
+    return memory
+
+
+def _view(memory: SharedMemory) -> memoryview:
+    # the contents of an open block (its buf is only None once it is closed)
+    if memory.buf is None:
+        raise ValueError(f'shared memory block {memory.name} is closed')
+
+    return memory.buf
+
+
+def _close(memory: SharedMemory | mmap.mmap) -> None:
+    try:
+        memory.close()
+    except BufferError:
+        # some table still uses the block. it stays mapped in this process, and the block is kept here so that
+        # nothing tries to close it again while the table is alive
+        _lingering.append(memory)
+
+
+def _unlink(memory: SharedMemory) -> None:
+    _close(memory)
+    if _TRACKED:
+        # unlink unregisters the block, so it has to be registered again first
+        resource_tracker.register(memory._name, 'shared_memory')  # type: ignore[attr-defined]
+    memory.unlink()
+
+
+def share(table: CompiledDFA) -> SharedTable:
+    # publish the table in a new shared memory block, in the format of CompiledDFA.pack
+    data = table.pack()
+    memory = _open(size=max(len(data), 1))
+    _view(memory)[:len(data)] = data
+    _published[memory.name] = memory
+
+    return SharedTable(memory.name)
+
+
+def _text_width(text: str) -> int:
+    # the width of the narrowest of TEXT_ENCODINGS which holds every character of the text with a single code unit.
+    # utf-16 takes two units for the characters above U+FFFF and cannot encode lone surrogates, so a text with
+    # either needs 4 bytes. the pieces are only encoded to find out, which is much faster than comparing characters
+    if text.isascii():
+        return 1
+
+    width = 1
+    for start in range(0, len(text), TEXT_PIECE):
+        piece = text[start:start + TEXT_PIECE]
+        if width == 1:
+            try:
+                piece.encode('latin-1')
+                continue
+            except UnicodeEncodeError:
+                width = 2
+
+        try:
+            if len(piece.encode('utf-16-le')) == 2 * len(piece):
+                continue
+        except UnicodeEncodeError:
+            pass
+
+        return 4
+
+    return width
+
+
+def share_text(text: str | bytes) -> SharedText:
+    # publish the text in a new shared memory block. a str is encoded a piece of TEXT_PIECE characters at a time,
+    # so there is never a second copy of the whole text in this process
+    if isinstance(text, str):
+        width = _text_width(text)
+        memory = _open(size=max(len(text) * width, 1))
+        view = _view(memory)
+        for start in range(0, len(text), TEXT_PIECE):
+            piece = text[start:start + TEXT_PIECE].encode(TEXT_ENCODINGS[width], 'surrogatepass')
+            view[width * start:width * start + len(piece)] = piece
+    else:
+        width = 0
+        memory = _open(size=max(len(text), 1))
+        _view(memory)[:len(text)] = text
+    _published[memory.name] = memory
+
+    return SharedText(memory.name, len(text), width)
+
+
+def map_file(path: str) -> SharedText:
+    # a handle to the bytes of a file, which every worker maps on its own: the file is never read by this process
+    return SharedText(os.path.abspath(path), os.path.getsize(path), is_file=True)
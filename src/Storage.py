@@ -0,0 +1,115 @@
+import mmap
+import struct
+import sys
+from collections.abc import Buffer, Sequence
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .CompiledDFA import Symbol
+
+# the binary format shared by the compiled automata. a file starts with a fixed header
+#
+#   magic (4 bytes) | version (u16) | kind (u8) | byte order (u8) | n_ints (u32) | n_symbols (u32) | n_sections (u32)
+#
+# followed by n_ints signed 64 bit ints (the scalar fields of the automaton, like the number of states), the symbol
+# table (every symbol is a tag byte followed either by a u32 length and the utf-8 encoding of a str, or by a signed
+# 64 bit int) and a table of (offset, length) u64 pairs, one for every section. the sections hold the arrays of the
+# automaton in the native layout of the machine which wrote the file, each of them aligned to 8 bytes, so they can
+# be used in place from a memory map. everything before the sections is little-endian.
+
+MAGIC = b'LFA\0'
+VERSION = 1
+
+HEADER = struct.Struct('<4sHBBIII')
+SECTION = struct.Struct('<QQ')
+STR_SYMBOL = 0
+INT_SYMBOL = 1
+BYTE_ORDERS = {'little': 0, 'big': 1}
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def pack(kind: bytes, ints: Sequence[int], symbols: Sequence['Symbol'], sections: Sequence[Buffer]) -> bytes:
+    # the binary form of an automaton of the given kind (a single byte, e.g. b'D' for dfas)
+    head = bytearray(HEADER.pack(MAGIC, VERSION, kind[0], BYTE_ORDERS[sys.byteorder], len(ints), len(symbols),
+                                 len(sections)))
+    head += struct.pack(f'<{len(ints)}q', *ints)
+
+    for symbol in symbols:
+        if isinstance(symbol, str):
+            encoded = symbol.encode('utf-8')
+            head += struct.pack('<BI', STR_SYMBOL, len(encoded)) + encoded
+        elif isinstance(symbol, int):
+            head += struct.pack('<Bq', INT_SYMBOL, symbol)
+        else:
+            raise TypeError(f'cannot store symbol {symbol!r}')
+
+    views = [memoryview(section).cast('B') for section in sections]
+    offset = _align(len(head) + SECTION.size * len(views))
+    for view in views:
+        head += SECTION.pack(offset, view.nbytes)
+        offset = _align(offset + view.nbytes)
+
+    for view in views:
+        head += bytes(_align(len(head)) - len(head))
+        head += view
+
+    return bytes(head)
+
+
+def dump(path: str, kind: bytes, ints: Sequence[int], symbols: Sequence['Symbol'], sections: Sequence[Buffer]) -> None:
+    # write an automaton of the given kind to the file at 'path'
+    with open(path, 'wb') as f:
+        f.write(pack(kind, ints, symbols, sections))
+
+
+def unpack(data: bytes | memoryview | mmap.mmap, kind: bytes,
+           name: str = 'buffer') -> tuple[list[int], list['Symbol'], list[memoryview]]:
+    # the scalar fields, the symbol table and the sections of the automaton stored in 'data' by pack. the sections
+    # are views into 'data', so nothing is copied. 'name' is only used in error messages
+    magic, version, file_kind, byte_order, n_ints, n_symbols, n_sections = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError(f'{name} is not an automaton file')
+    if version != VERSION:
+        raise ValueError(f'{name} has format version {version}, expected {VERSION}')
+    if file_kind != kind[0]:
+        raise ValueError(f'{name} holds an automaton of kind {chr(file_kind)!r}, expected {kind.decode()!r}')
+    if byte_order != BYTE_ORDERS[sys.byteorder]:
+        raise ValueError(f'{name} was written on a machine with a different byte order')
+
+    offset = HEADER.size
+    ints = list(struct.unpack_from(f'<{n_ints}q', data, offset))
+    offset += 8 * n_ints
+
+    symbols: list['Symbol'] = []
+    for _ in range(n_symbols):
+        tag = data[offset]
+        if tag == STR_SYMBOL:
+            (length,) = struct.unpack_from('<I', data, offset + 1)
+            symbols.append(bytes(data[offset + 5:offset + 5 + length]).decode('utf-8'))
+            offset += 5 + length
+        else:
+            (value,) = struct.unpack_from('<q', data, offset + 1)
+            symbols.append(value)
+            offset += 9
+
+    view = memoryview(data).cast('B')
+    sections = []
+    for _ in range(n_sections):
+        start, length = SECTION.unpack_from(data, offset)
+        sections.append(view[start:start + length])
+        offset += SECTION.size
+
+    return ints, symbols, sections
+
+
+def load(path: str, kind: bytes) -> tuple[list[int], list['Symbol'], list[memoryview]]:
+    # memory-map the file at 'path' and return the scalar fields, the symbol table and the sections of the
+    # automaton stored in it. the sections are read-only views into the map, so nothing is copied and processes
+    # loading the same file share its pages. the map stays open as long as any of the views is alive.
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    return unpack(data, kind, path)
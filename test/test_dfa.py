@@ -0,0 +1,453 @@
+import itertools
+import mmap
+import multiprocessing
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+from src import CodeGen, Parallel, Shared
+from src.CompiledDFA import CompiledDFA, SINK
+from src.DFA import DFA
+from src.NFA import NFA
+from src.Regex import parse_regex
+
+
+def all_words(alphabet: str, max_len: int):
+    for length in range(max_len + 1):
+        for word in itertools.product(alphabet, repeat=length):
+            yield ''.join(word)
+
+
+class CountingText(list):
+    # a text which counts how many times its symbols are read
+    reads = 0
+
+    def __getitem__(self, index):
+        self.reads += 1
+        return super().__getitem__(index)
+
+
+def accept_shared(handle, word):
+    return handle.attach().accept(word)
+
+
+class DFATests(unittest.TestCase):
+    def test_compile_numbering(self):
+        dfa = DFA({'a', 'b'}, {'x', 'y', 'z'}, 'y', {('y', 'a'): 'x', ('x', 'b'): 'y'}, {'x'})
+        table = dfa.compile()
+
+        self.assertEqual(table.q0, 0)
+        self.assertEqual(table.n_states, 3)
+        self.assertEqual(table.step(0, 'a'), 1)
+        self.assertEqual(table.step(0, 'b'), SINK)
+        self.assertEqual(table.step(0, 'c'), SINK)
+
+    def test_compiled_accept(self):
+        dfa = parse_regex('(a|b)*abb').thompson().subset_construction()
+        table = dfa.compile()
+
+        for word in all_words('abc', 6):
+            self.assertEqual(table.accept(word), dfa.accept(word), word)
+            self.assertEqual(dfa.accept(word), word.endswith('abb') and 'c' not in word, word)
+
+    def test_table_cache(self):
+        dfa = DFA({'a'}, {0, 1}, 0, {(0, 'a'): 1}, {1})
+        self.assertTrue(dfa.accept('a'))
+        self.assertEqual(dfa.compress().cells(), dfa.compress().cells())
+
+        dfa.F.add(0)
+        self.assertTrue(dfa.accept(''))
+        dfa.d[(1, 'a')] = 0
+        self.assertTrue(dfa.accept('aaa'))
+        self.assertTrue(dfa.compress().accept('aaa'))
+        dfa.S = {'a', 'b'}
+        dfa.d = {(0, 'b'): 1}
+        self.assertEqual((dfa.accept('a'), dfa.accept('b')), (False, True))
+        dfa.q0 = 1
+        self.assertFalse(dfa.accept('b'))
+
+    def test_minimize(self):
+        dfa = parse_regex('(a|b)*abb').thompson().subset_construction()
+        minimal = dfa.minimize()
+
+        self.assertEqual(len(minimal.K), 4)
+        for word in all_words('ab', 7):
+            self.assertEqual(minimal.accept(word), dfa.accept(word), word)
+
+    def test_minimize_partial(self):
+        # 1 and 2 are equivalent and the missing transitions go to the same implicit sink as the dead state 3
+        dfa = DFA({'a', 'b'}, {0, 1, 2, 3}, 0, {(0, 'a'): 1, (0, 'b'): 2, (1, 'a'): 3, (2, 'a'): 3, (3, 'b'): 3},
+                  {1, 2})
+        minimal = dfa.minimize()
+
+        self.assertEqual(len(minimal.K), 3)
+        self.assertEqual(minimal.d, {(0, 'a'): 1, (0, 'b'): 1, (1, 'a'): 2, (1, 'b'): 2, (2, 'a'): 2, (2, 'b'): 2})
+        self.assertEqual(minimal.F, {1})
+
+    def test_accept_many(self):
+        dfa = parse_regex('(a|b)*abb').thompson().subset_construction()
+        words = list(all_words('abc', 5)) + ['a' * 40 + 'bb', 'c' * 40 + 'abb', 'ab' * 30 + 'b']
+
+        self.assertEqual(list(dfa.accept_many(words)), [dfa.accept(word) for word in words])
+        self.assertEqual(list(dfa.accept_many([word.encode() for word in words])), [False] * len(words))
+        self.assertEqual(list(dfa.accept_many([])), [])
+
+    def test_save_load(self):
+        dfa = parse_regex('(a|b)*abb').thompson().subset_construction()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'dfa.bin')
+            dfa.save(path)
+            table = CompiledDFA.load(path)
+
+            self.assertIsInstance(table.table, memoryview)
+            self.assertEqual(table.symbols, dfa.table().symbols)
+            for word in all_words('abc', 6):
+                self.assertEqual(table.accept(word), dfa.accept(word), word)
+
+            del table
+
+    def test_product(self):
+        ends_abb = parse_regex('(a|b)*abb').thompson().subset_construction()
+        even = parse_regex('((a|b)(a|b))*').thompson().subset_construction()
+
+        for operation in ['intersection', 'union', 'difference', 'symmetric_difference']:
+            lazy = ends_abb.product(even, operation)
+            eager = ends_abb.product_dfa(even, operation)
+            minimal = eager.minimize()
+
+            for word in all_words('abc', 7):
+                left, right = ends_abb.accept(word), even.accept(word)
+                expected = {
+                    'intersection': left and right,
+                    'union': left or right,
+                    'difference': left and not right,
+                    'symmetric_difference': left != right,
+                }[operation]
+
+                self.assertEqual(lazy.accept(word), expected, (operation, word))
+                self.assertEqual(eager.accept(word), expected, (operation, word))
+                self.assertEqual(minimal.accept(word), expected, (operation, word))
+
+    def test_equivalent(self):
+        ends_abb = parse_regex('(a|b)*abb').thompson().subset_construction()
+        same = parse_regex('(a*b*)*abb').thompson().subset_construction()
+        different = parse_regex('(a|b)*ab(b|a)').thompson().subset_construction()
+
+        self.assertTrue(ends_abb.equivalent(same))
+        self.assertTrue(ends_abb.equivalent(ends_abb.minimize()))
+        self.assertFalse(ends_abb.equivalent(different))
+
+        word = ends_abb.counterexample(different)
+        self.assertNotEqual(ends_abb.accept(word), different.accept(word))
+        self.assertEqual(ends_abb.counterexample(DFA({'a'}, {0}, 0, {}, {0})), '')
+
+    def test_trim(self):
+        dfa = parse_regex('a(a|b)*').thompson().subset_construction()
+
+        self.assertEqual(dfa.dead_states(), {frozenset()})
+        self.assertEqual(dfa.compile().run('ba'), SINK)
+        self.assertNotEqual(dfa.compile(trim=False).run('ba'), SINK)
+
+        trimmed = dfa.trim()
+        self.assertEqual(len(trimmed.K), len(dfa.K) - 1)
+        for word in all_words('ab', 6):
+            self.assertEqual(trimmed.accept(word), dfa.accept(word), word)
+
+    def test_matcher(self):
+        dfa = parse_regex('(a|b)*abb').thompson().subset_construction()
+        matcher = dfa.matcher()
+
+        for chunk in ['ab', '', 'aab', 'b']:
+            matcher.feed(chunk)
+        self.assertTrue(matcher.accepted)
+        self.assertFalse(matcher.dead)
+
+        matcher.feed('b')
+        self.assertFalse(matcher.accepted)
+        self.assertFalse(matcher.finish())
+
+        matcher.feed('abbc')
+        self.assertTrue(matcher.dead)
+        matcher.feed('abb')
+        self.assertFalse(matcher.finish())
+
+        matcher.feed('abb')
+        self.assertTrue(matcher.finish())
+
+    def test_mmap_input(self):
+        nfa = parse_regex('[a-z]*é[0-9]+').thompson().to_bytes()
+        dfa = nfa.subset_construction()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'log')
+            with open(path, 'wb') as f:
+                f.write('logé42'.encode())
+            with open(path, 'rb') as f:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            self.assertTrue(dfa.accept(mapping))
+            self.assertTrue(dfa.compress().accept(mapping))
+            self.assertTrue(nfa.accept(mapping))
+            self.assertTrue(nfa.lazy().accept(mapping))
+            matcher = dfa.matcher()
+            matcher.feed(mapping)
+            self.assertTrue(matcher.finish())
+            mapping.close()
+
+    def test_search(self):
+        dfa = parse_regex('ab*|b+c').thompson().subset_construction()
+
+        self.assertEqual(dfa.search('xxabbbc'), (2, 6))
+        self.assertEqual(dfa.search('xxbbbc'), (2, 6))
+        self.assertEqual(dfa.search('xxbbb'), None)
+        self.assertEqual(list(dfa.finditer('abbxbcaab')), [(0, 3), (4, 6), (6, 7), (7, 9)])
+
+        # the longest match starting at the leftmost position, even if a shorter one ends earlier
+        dfa = parse_regex('bbbbc|b').thompson().subset_construction()
+        self.assertEqual(dfa.search('abbbbc'), (1, 6))
+        dfa = parse_regex('abbbc|b').thompson().subset_construction()
+        self.assertEqual(dfa.search('abbbc'), (0, 5))
+        self.assertEqual(list(dfa.finditer('abbbbc')), [(1, 2), (2, 3), (3, 4), (4, 5)])
+
+    def test_search_empty(self):
+        dfa = parse_regex('a*').thompson().subset_construction()
+
+        self.assertEqual(list(dfa.finditer('baab')), [(0, 0), (1, 3), (3, 3), (4, 4)])
+        # the run which ends the match (1, 3) is in the initial state, like the run the next search starts there
+        minimal = parse_regex('b*').thompson().subset_construction().minimize()
+        self.assertEqual(len(minimal.K), 1)
+        self.assertEqual(list(minimal.finditer('xbbx')), [(0, 0), (1, 3), (3, 3), (4, 4)])
+        self.assertEqual(list(parse_regex('b*').thompson().finditer('xbbx')), [(0, 0), (1, 3), (3, 3), (4, 4)])
+
+    def test_finditer_single_pass(self):
+        # every search here would read the rest of the text looking for a b, so searching again from the end of
+        # each match reads the text once per match. the runs of the next searches are carried along instead.
+        nfa = parse_regex('a|a*b').thompson()
+        dfa = nfa.subset_construction()
+        for n in [100, 1000, 4000]:
+            for matcher in [dfa, nfa]:
+                text = CountingText('a' * n)
+                self.assertEqual(list(matcher.finditer(text)), [(i, i + 1) for i in range(n)])
+                self.assertLessEqual(text.reads, 2 * n)
+
+    def test_parallel(self):
+        dfa = parse_regex('(a|b)*abb').thompson().subset_construction()
+        text = 'abbab' * 200 + 'babb'
+
+        self.assertTrue(dfa.accept_parallel(text, processes=3))
+        self.assertFalse(dfa.accept_parallel(text + 'a', processes=3))
+        self.assertFalse(dfa.accept_parallel(text + 'c' + text, processes=4))
+
+        unanchored = parse_regex('ab').thompson().subset_construction().unanchored()
+        self.assertEqual(unanchored.count_prefixes_parallel(text, processes=3), text.count('ab'))
+
+    def test_unanchored_other_symbols(self):
+        dfa = parse_regex('[0-9]+@[a-z]+\\.com').thompson().subset_construction()
+        unanchored = dfa.unanchored()
+        text = 'mail 42@example.com, 7@x.com!'
+
+        self.assertTrue(unanchored.accept('mail 42@example.com'))
+        self.assertFalse(unanchored.accept(text))
+        self.assertEqual(unanchored.count_prefixes_parallel(text, processes=3), len(list(dfa.finditer(text))))
+        self.assertEqual(unanchored.minimize().count_prefixes_parallel(text, processes=2), 2)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'unanchored.lfa')
+            unanchored.save(path)
+            self.assertTrue(CompiledDFA.load(path).accept('mail 42@example.com'))
+
+        unanchored = parse_regex('ab').thompson().subset_construction().unanchored()
+        self.assertEqual(unanchored.count_prefixes_parallel('ab xab ab', processes=3), 3)
+        self.assertTrue(unanchored.compress().accept('x ab'))
+
+        unanchored = parse_regex('a+').thompson().subset_construction().unanchored()
+        self.assertEqual(unanchored.count_prefixes_parallel('aaa', processes=2), 3)
+
+    def test_other_symbols_products(self):
+        unanchored = parse_regex('ab').thompson().subset_construction().unanchored()
+        restricted = DFA(unanchored.S, unanchored.K, unanchored.q0, unanchored.d, unanchored.F)
+        never = DFA({'a'}, {0}, 0, {}, set())
+
+        self.assertTrue(unanchored.accept('x ab'))
+        self.assertFalse(restricted.accept('x ab'))
+        self.assertFalse(unanchored.equivalent(restricted))
+        word = unanchored.counterexample(restricted)
+        self.assertNotEqual(unanchored.accept(word), restricted.accept(word))
+        self.assertTrue(unanchored.equivalent(unanchored.minimize()))
+
+        self.assertTrue(unanchored.product(never, 'union').accept('x ab'))
+        self.assertTrue(unanchored.union(never).accept('x ab'))
+        self.assertTrue(unanchored.difference(restricted).minimize().accept('x ab'))
+        self.assertFalse(unanchored.intersection(restricted).accept('x ab'))
+
+        with self.assertRaises(ValueError):
+            NFA.from_dfa(unanchored)
+
+    def test_parallel_shared_text(self):
+        dfa = parse_regex('[0-9]+@[a-z]+\\.com').thompson().to_bytes().subset_construction()
+        unanchored = dfa.unanchored()
+        text = 'mail 42@example.com, 7@x.com! ünïcode 1@y.com'.encode() * 50
+
+        self.assertEqual(unanchored.count_prefixes_parallel(text, processes=3), 150)
+        with Shared.share_text(text) as handle:
+            self.assertEqual(unanchored.count_prefixes_parallel(handle, processes=4), 150)
+            self.assertEqual(bytes(handle.read(5, 19)), b'42@example.com')
+            handle.detach()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'text')
+            with open(path, 'wb') as f:
+                f.write(text)
+            self.assertEqual(unanchored.count_prefixes_parallel(Shared.map_file(path), processes=3), 150)
+            self.assertFalse(dfa.accept_parallel(Shared.map_file(path), processes=2))
+
+        with Shared.share_text('a\U0001f600b' * 3) as handle:
+            self.assertEqual(handle.read(1, 5), '\U0001f600ba\U0001f600')
+            handle.detach()
+
+        # a str takes as few bytes per character as its widest character needs
+        for text, width in [('abc', 1), ('ünï', 1), ('abЖ', 2), ('a\ud800b', 4), ('a' * 5 + 'Ж\U0001f600', 4)]:
+            with mock.patch('src.Shared.TEXT_PIECE', 3), Shared.share_text(text) as handle:
+                self.assertEqual(handle.width, width)
+                self.assertEqual(handle.read(1, len(text)), text[1:])
+                handle.detach()
+
+    def test_run_from_states(self):
+        table = parse_regex('a(ba)*').thompson().subset_construction().compile()
+        starts = list(range(table.n_states))
+        ends, counts = Parallel.run_from_states(table, 'baba', starts)
+
+        for start, end, count in zip(starts, ends, counts):
+            self.assertEqual(end, table.run('baba', start))
+            expected = 0
+            for length in range(1, 5):
+                expected += table.is_final(table.run('baba'[:length], start))
+            self.assertEqual(count, expected)
+
+    def test_compress(self):
+        dfa = parse_regex('(if | else | [a-z]+ | [0-9]+)(\\ )*').thompson().subset_construction()
+        table = dfa.table()
+        comb = dfa.compress()
+
+        for state, symbol in itertools.product(range(table.n_states), [*dfa.S, '!']):
+            self.assertEqual(comb.step(state, symbol), table.step(state, symbol), (state, symbol))
+        for word in ['if', 'else  ', 'abc1', '123 ', '', '!']:
+            self.assertEqual(comb.accept(word), dfa.accept(word), word)
+
+        sizes = dfa.table_sizes()
+        self.assertEqual(sizes['dense'], table.n_states * table.n_columns)
+        self.assertEqual(sizes['comb'], comb.cells())
+        self.assertIs(dfa.compress(), comb)
+
+    def test_compress_many_states(self):
+        rng = random.Random(0)
+        words = [''.join(rng.choice('abcdefghij') for _ in range(rng.randint(1, 10))) for _ in range(3000)]
+        dfa = DFA.from_words(words)
+        table = dfa.table()
+        comb = dfa.compress()
+
+        self.assertLess(comb.cells(), len(table.table))
+        for state, symbol in itertools.product(range(table.n_states), 'abcdefghijk'):
+            self.assertEqual(comb.step(state, symbol), table.step(state, symbol), (state, symbol))
+
+    def test_python_source(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for regex in ['(a|b)*abb', 'while | whale | (ab)*c', '([a-c] | _)([a-c] | [0-9] | _)*']:
+                dfa = parse_regex(regex).thompson().subset_construction()
+                accept = CodeGen.compile_dfa(dfa, cache_dir=directory)
+
+                for word in all_words('abc_0wh', 4):
+                    self.assertEqual(accept(word), dfa.accept(word), (regex, word))
+                for word in ['while', 'whale', 'ababc', 'whi', 'abab']:
+                    self.assertEqual(accept(word), dfa.accept(word), (regex, word))
+
+            byte_dfa = parse_regex('[a-z]+@[0-9]').thompson().to_bytes().subset_construction()
+            accept = CodeGen.compile_dfa(byte_dfa, cache_dir=directory)
+            for word in [b'abc@1', b'abc@', b'@1', 'é@1'.encode()]:
+                self.assertEqual(accept(word), byte_dfa.accept(word), word)
+
+            # the module is cached on disk under the hash of its source
+            self.assertIs(CodeGen.compile_dfa(byte_dfa, cache_dir=directory), accept)
+            self.assertEqual(len([name for name in os.listdir(directory) if name.endswith('.py')]), 4)
+
+    def test_python_source_cache(self):
+        dfa = parse_regex('(a|b)*abb').thompson().subset_construction()
+        with tempfile.TemporaryDirectory() as directory:
+            CodeGen.compile_dfa(dfa, cache_dir=directory)
+            (path,) = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.py')]
+
+            # a module which does not hold the generated source is written again instead of being imported
+            with open(path, 'w') as f:
+                f.write('raise RuntimeError\n')
+            CodeGen._loaded.clear()
+            self.assertTrue(CodeGen.compile_dfa(dfa, cache_dir=directory)('aabb'))
+
+            if os.name == 'posix':
+                os.chmod(directory, 0o777)
+                CodeGen._loaded.clear()
+                with self.assertRaises(PermissionError):
+                    CodeGen.compile_dfa(dfa, cache_dir=directory)
+                os.chmod(directory, 0o700)
+
+    def test_python_source_fallback(self):
+        # too many states for the generated dispatch, or symbols outside the alphabet: the table is used
+        rng = random.Random(0)
+        words = [''.join(rng.choice('abcdefgh') for _ in range(6)) for _ in range(200)]
+        dfa = DFA.from_words(words)
+        unanchored = parse_regex('ab').thompson().subset_construction().unanchored()
+
+        with tempfile.TemporaryDirectory() as directory:
+            accept = CodeGen.compile_dfa(dfa, cache_dir=directory)
+            self.assertGreater(dfa.minimize().table().n_states, CodeGen.MAX_STATES)
+            self.assertIsInstance(accept.__self__, CompiledDFA)
+            for word in words[:20] + ['abcdef', 'hhhhhh', 'abc']:
+                self.assertEqual(accept(word), word in words, word)
+
+            accept = CodeGen.compile_dfa(unanchored, cache_dir=directory)
+            self.assertTrue(accept('x ab'))
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_count_accepted(self):
+        dfa = parse_regex('(a|b)*abb | c+').thompson().subset_construction()
+        for length in range(7):
+            expected = sum(dfa.accept(word) for word in all_words('abc', length) if len(word) == length)
+            self.assertEqual(dfa.count_accepted(length), expected, length)
+
+        self.assertEqual(dfa.count_accepted(40), 2 ** 37 + 1)
+        # too large for int64, counted exactly
+        self.assertEqual(dfa.count_accepted(1000), 2 ** 997 + 1)
+        identifier = parse_regex('([a-z] | _)([a-z] | [0-9] | _)*').thompson().subset_construction()
+        self.assertEqual(identifier.count_accepted(100), 27 * 37 ** 99)
+
+    def test_from_words(self):
+        words = ['if', 'iff', 'elif', 'else', 'for', 'form', 'format', 'while', '']
+        dfa = DFA.from_words(words)
+
+        for word in [*words, 'i', 'el', 'forma', 'formats', 'whil', 'x']:
+            self.assertEqual(dfa.accept(word), word in words, word)
+        self.assertEqual(len(dfa.K), len(dfa.minimize().K))
+        self.assertTrue(dfa.equivalent(parse_regex(' | '.join(filter(None, words))).thompson().subset_construction()
+                                       .union(DFA.from_words(['']))))
+
+        byte_dfa = DFA.from_words([word.encode() for word in words])
+        self.assertTrue(byte_dfa.accept(b'format'))
+        self.assertFalse(byte_dfa.accept(b'forma'))
+
+    def test_share(self):
+        dfa = parse_regex('(a|b)*abb').thompson().subset_construction()
+        words = ['abb', 'ab', 'babb', 'abbc', '']
+
+        with dfa.share() as handle:
+            table = handle.attach()
+            self.assertIsInstance(table.table, memoryview)
+            self.assertEqual([table.accept(word) for word in words], [dfa.accept(word) for word in words])
+
+            with multiprocessing.Pool(2) as pool:
+                results = pool.starmap(accept_shared, [(handle, word) for word in words])
+            self.assertEqual(results, [dfa.accept(word) for word in words])
+
+        with self.assertRaises(FileNotFoundError):
+            handle.attach()
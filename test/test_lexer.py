@@ -0,0 +1,62 @@
+import multiprocessing
+import unittest
+
+from src.CombDFA import CombDFA
+from src.DFA import DFA
+from src.Lexer import Lexer
+
+
+def lex_shared(handle, word):
+    return handle.attach().lex(word)
+
+
+class LexerTests(unittest.TestCase):
+    def test_minimized_states(self):
+        lexer = Lexer([('IF', 'if'), ('ID', '[a-z]+'), ('SPACE', '\\ ')])
+
+        # start, space, sink, 'i', 'if' and one state for every other identifier
+        self.assertEqual(len(lexer.lexer.K), 6)
+        self.assertEqual(sorted(lexer.tokens.values()), ['ID', 'ID', 'IF', 'SPACE'])
+        self.assertEqual(
+            lexer.lex('if iff x'),
+            [('IF', 'if'), ('SPACE', ' '), ('ID', 'iff'), ('SPACE', ' '), ('ID', 'x')],
+        )
+
+    def test_byte_level(self):
+        spec = [('WORD', '([a-z] | é)+'), ('NUM', '[0-9]+'), ('SPACE', '\\ '), ('NEWLINE', '\n')]
+        lexer = Lexer(spec, byte_level=True)
+        text = 'café 42\nx'.encode('utf-8')
+
+        expected = [('WORD', 'café'.encode('utf-8')), ('SPACE', b' '), ('NUM', b'42'), ('NEWLINE', b'\n'), ('WORD', b'x')]
+        self.assertEqual(lexer.lex(text), expected)
+        self.assertEqual(lexer.lex(memoryview(bytearray(text))), expected)
+        self.assertEqual(lexer.lex(b'ab\n!'), [('', 'No viable alternative at character 0, line 1')])
+
+    def test_compressed(self):
+        spec = [('IF', 'if'), ('ID', '([a-z] | [A-Z])+'), ('NUM', '[0-9]+'), ('SPACE', '\\ ')]
+        lexer = Lexer(spec)
+        compressed = Lexer(spec, compressed=True)
+
+        self.assertIsInstance(compressed.table, CombDFA)
+        for word in ['if x1 42', 'iff', 'x y', '1a', 'a!', '']:
+            self.assertEqual(compressed.lex(word), lexer.lex(word), word)
+
+    def test_dfa_patterns(self):
+        keywords = DFA.from_words(['if', 'else', 'elif', 'while'])
+        spec = [('KEYWORD', keywords), ('ID', '[a-z]+'), ('SPACE', '\\ ')]
+
+        self.assertEqual(
+            Lexer(spec).lex('if elif elifx'),
+            [('KEYWORD', 'if'), ('SPACE', ' '), ('KEYWORD', 'elif'), ('SPACE', ' '), ('ID', 'elifx')],
+        )
+        self.assertEqual(Lexer(spec, byte_level=True).lex(b'while w'),
+                         [('KEYWORD', b'while'), ('SPACE', b' '), ('ID', b'w')])
+
+    def test_share(self):
+        lexer = Lexer([('IF', 'if'), ('ID', '[a-z]+'), ('NUM', '[0-9]+'), ('SPACE', '\\ ')])
+        words = ['if x 42', 'iff', '4a', 'x!']
+
+        with lexer.share() as handle:
+            with multiprocessing.Pool(2) as pool:
+                results = pool.starmap(lex_shared, [(handle, word) for word in words])
+        self.assertEqual(results, [lexer.lex(word) for word in words])
@@ -0,0 +1,171 @@
+import itertools
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+from src.NFA import NFA
+from src.Regex import parse_regex
+
+
+class NFATests(unittest.TestCase):
+    def test_save_load(self):
+        nfa = NFA(
+            {'a', 'b'},
+            {'s', 't', 'u'},
+            't',
+            {('t', ''): {'s'}, ('s', 'a'): {'s', 'u'}, ('u', 'b'): {'t'}},
+            {'u'},
+        )
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'nfa.bin')
+            nfa.save(path)
+            loaded = NFA.load(path)
+
+        self.assertEqual(loaded.S, {'a', 'b'})
+        self.assertEqual(loaded.K, {0, 1, 2})
+        self.assertEqual(loaded.q0, 0)
+        self.assertEqual(len(loaded.F), 1)
+        for word in ['', 'a', 'ab', 'aa', 'aba', 'abaa', 'b']:
+            self.assertEqual(loaded.subset_construction().accept(word), nfa.subset_construction().accept(word), word)
+
+    def test_to_bytes(self):
+        nfa = NFA({'a', 'é', 'è'}, {0, 1}, 0, {(0, 'a'): {1}, (0, 'é'): {1}, (0, 'è'): {1}, (1, ''): {0}}, {1})
+        dfa = nfa.to_bytes().subset_construction()
+
+        self.assertEqual(dfa.S, {ord('a'), 0xc3, 0xa9, 0xa8})
+        for word in ['a', 'é', 'aèé', 'ae', '']:
+            self.assertEqual(dfa.accept(word.encode('utf-8')), nfa.subset_construction().accept(word), word)
+        self.assertTrue(dfa.accept(memoryview(bytearray('éa'.encode('utf-8')))))
+        self.assertFalse(dfa.accept('é'.encode('utf-8')[:1]))
+
+    def test_symbol_classes(self):
+        nfa = parse_regex('[a-z]([a-z] | [0-9])*x').thompson()
+        classes = sorted(nfa.symbol_classes(), key=len)
+
+        self.assertEqual(classes[0], ['x'])
+        self.assertEqual(classes[1], [chr(i) for i in range(ord('0'), ord('9') + 1)])
+        self.assertEqual(len(classes[2]), 25)
+
+        dfa = nfa.subset_construction()
+        self.assertEqual(dfa.compile().n_columns, 3)
+        for word in ['ax', 'a0x', 'x', 'xx', 'a0', '0x', 'abc9x']:
+            self.assertEqual(dfa.accept(word), len(word) > 1 and word[0].isalpha() and word[-1] == 'x', word)
+
+    def test_determinize(self):
+        nfa = parse_regex('(a|b)*abb').thompson()
+        subsets = []
+        dfa = nfa.determinize(lambda state, subset: subsets.append((state, subset)))
+
+        self.assertEqual(dfa.K, set(range(len(dfa.K))))
+        self.assertEqual([state for state, _ in subsets], list(range(len(dfa.K))))
+        self.assertEqual(subsets[0][1], frozenset(nfa.epsilon_closure(nfa.q0)))
+        self.assertEqual(dfa.d[(0, 'a')], 1)
+        self.assertEqual(dfa.d[(0, 'b')], 2)
+        for word in ['abb', 'aabb', 'ab', 'abba', '']:
+            self.assertEqual(dfa.accept(word), word.endswith('abb'), word)
+
+    def test_closures(self):
+        rng = random.Random(0)
+        for _ in range(20):
+            d = {}
+            for state in range(30):
+                if rng.random() < 0.7:
+                    d[(state, '')] = set(rng.sample(range(30), rng.randint(1, 3)))
+                d[(state, 'a')] = {rng.randrange(30)}
+            nfa = NFA({'a'}, set(range(30)), 0, d, {29})
+
+            states, state_index, closures = nfa.closures()
+            for state in range(30):
+                # a plain search of the epsilon graph
+                closure = {state}
+                queue = [state]
+                for current_state in queue:
+                    for next_state in d.get((current_state, ''), ()):
+                        if next_state not in closure:
+                            closure.add(next_state)
+                            queue.append(next_state)
+
+                self.assertEqual(nfa.epsilon_closure(state), closure)
+                self.assertEqual(set(nfa.states_of(closures[state_index[state]])), closure)
+                self.assertEqual({states[index] for index in nfa.closure_sets()[state_index[state]]}, closure)
+
+    def test_determinize_sparse(self):
+        # above SPARSE_STATES nfa states the subsets are sets instead of bitsets, which should give the same dfa
+        for regex in ['(a|b)*abb', '(a|b)*a(a|b)(a|b)', '((a|b)*|c)*c', '([a-z] | _)([a-z] | [0-9] | _)*']:
+            nfa = parse_regex(regex).thompson()
+            dense_subsets, sparse_subsets = [], []
+            dense = nfa.determinize(lambda state, subset: dense_subsets.append(subset))
+            with mock.patch('src.NFA.SPARSE_STATES', 0):
+                sparse = nfa.determinize(lambda state, subset: sparse_subsets.append(subset))
+
+            self.assertEqual((sparse.K, sparse.d, sparse.F), (dense.K, dense.d, dense.F), regex)
+            self.assertEqual(sparse_subsets, dense_subsets, regex)
+
+    def test_accept(self):
+        for regex in ['(a|b)*abb', '(a|b)*a(a|b)(a|b)', 'a*(b|c*)', '((a|b)*|c)*c']:
+            nfa = parse_regex(regex).thompson()
+            dfa = nfa.subset_construction()
+            for length in range(6):
+                for word in map(''.join, itertools.product('abc', repeat=length)):
+                    self.assertEqual(nfa.accept(word), dfa.accept(word), (regex, word))
+
+        byte_nfa = parse_regex('(a | é)+').thompson().to_bytes()
+        self.assertTrue(byte_nfa.accept('aé'.encode('utf-8')))
+        self.assertFalse(byte_nfa.accept('é'.encode('utf-8')[:1]))
+
+    def test_search(self):
+        rng = random.Random(0)
+        for regex in ['ab*', 'a(a|b)(a|b)', 'b*', '[0-9]+@[a-z]+\\.com', 'bbbbc|b']:
+            nfa = parse_regex(regex).thompson()
+            dfa = nfa.subset_construction()
+            for _ in range(50):
+                text = ''.join(rng.choice('ab0@.com') for _ in range(rng.randint(0, 12)))
+                self.assertEqual(nfa.search(text), dfa.search(text), (regex, text))
+                self.assertEqual(list(nfa.finditer(text)), list(dfa.finditer(text)), (regex, text))
+
+    def test_lazy(self):
+        nfa = parse_regex('(a|b)*a(a|b)(a|b)').thompson()
+        dfa = nfa.subset_construction()
+        words = [''.join(word) for length in range(7) for word in itertools.product('abc', repeat=length)]
+
+        lazy = nfa.lazy()
+        self.assertEqual([lazy.accept(word) for word in words], [dfa.accept(word) for word in words])
+        self.assertEqual(lazy.clears, 0)
+        self.assertLessEqual(len(lazy.subsets), len(dfa.K))
+
+        # a cache too small for the words, cleared over and over, falls back to simulating the nfa
+        small = nfa.lazy(max_states=3)
+        self.assertEqual([small.accept(word) for word in words], [dfa.accept(word) for word in words])
+        self.assertGreater(small.clears, 0)
+        self.assertGreater(small.fallbacks, 0)
+        self.assertLessEqual(len(small.subsets), 3)
+
+    def test_remove_epsilons(self):
+        for regex in ['(a|b)*abb', 'a*(b|c*)', '((a|b)*|c)*c', '[a-c]([a-c] | [0-9])*', 'a | ab*']:
+            nfa = parse_regex(regex).thompson()
+            free = nfa.remove_epsilons()
+
+            self.assertFalse(any(symbol == '' for _, symbol in free.d))
+            self.assertLess(len(free.K), len(nfa.K))
+            for length in range(5):
+                for word in map(''.join, itertools.product('abc0', repeat=length)):
+                    self.assertEqual(free.accept(word), nfa.accept(word), (regex, word))
+            self.assertTrue(free.subset_construction().equivalent(nfa.subset_construction()))
+
+        # useless states are pruned
+        nfa = NFA({'a', 'b'}, {0, 1, 2}, 0, {(0, 'a'): {1, 2}, (1, 'b'): {1}, (0, ''): {2}}, {2})
+        self.assertEqual(nfa.remove_epsilons().K, {0, 2})
+
+    def test_adjacency(self):
+        nfa = NFA({'a', 'b'}, {0, 1, 2, 3}, 0, {(0, 'a'): {1}, (1, ''): {2}, (2, 'b'): {3}, (0, ''): {3}}, {3})
+        states, state_index, closures = nfa.closures()
+        outgoing, epsilon = nfa.adjacency()
+
+        self.assertEqual({states[index]: set(edges) for index, edges in enumerate(outgoing)},
+                         {0: {'a'}, 1: set(), 2: {'b'}, 3: set()})
+        self.assertEqual(set(nfa.states_of(outgoing[state_index[0]]['a'])), {1, 2})
+        self.assertEqual([states[index] for index in epsilon[state_index[0]]], [3])
+        self.assertEqual(set(nfa.states_of(nfa.step_bits(closures[state_index[0]], 'a'))), {1, 2})